@@ -9,7 +9,7 @@ from bot.admin.keyboard import Keyboard
 from bot.common.database_utils import is_admin, get_admins
 from bot.common.date import convert_timestamp_to_date
 from bot.languages.response import get_response
-from bot.common.database_utils import fetch_user_data_by_id
+from bot.common.database_utils import fetch_user_data_by_id, PROFILE_VIEW
 
 class Admin:
     """
@@ -23,7 +23,7 @@ class Admin:
         Main admin panel
         :param msg: Message object
         """
-        if not is_admin(msg.from_user.id):
+        if not await is_admin(msg.from_user.id):
             await self.bot.send_message(msg.chat.id, get_response('errors.no_active_chat'))
             return
         await self.bot.send_message(msg.chat.id, get_response('admin.panel',
@@ -35,7 +35,7 @@ class Admin:
         Announce new user to all admins
         :param user_id: ID of the new user
         """
-        user_data = fetch_user_data_by_id(user_id)
+        user_data = await fetch_user_data_by_id(user_id, PROFILE_VIEW)
         stats_data = {
             "first_name": user_data.get('first_name', 'N/A'),
             "last_name": user_data.get('last_name', 'N/A'),
@@ -59,7 +59,7 @@ class Admin:
         Help command for admin
         :param msg: Message object
         """
-        if not is_admin(msg.from_user.id):
+        if not await is_admin(msg.from_user.id):
             await self.bot.send_message(msg.chat.id, get_response('errors.no_active_chat'))
             return
         await self.bot.send_message(msg.chat.id, get_response('admin.help'), parse_mode='Markdown')
@@ -1,12 +1,24 @@
 from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
+
+import jdatetime
+from decouple import config
 
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
-from bot.database.database import users_collection, bot_collection
+from bot.admin.keyboard import Keyboard
+from bot.common.counters import bot_counters
+from bot.common.date import convert_timestamp_to_date
+from bot.common.metrics import count_metric
+from bot.common.stats import stats_rollup, period_starts, TEHRAN, StatsService
+from bot.common.validators import MessageValidator
+from bot.database.database import users_collection, bot_collection, chats_collection
 from bot.languages.response import get_response
 
+GROWTH_DAYS = 30
+BAN_LIST_PAGE_SIZE = config('BAN_LIST_PAGE_SIZE', default=20, cast=int)
+BAN_LIST_VIEW = {"_id": 0, "user_id": 1, "id": 1, "nickname": 1, "banned_at": 1, "banned_by": 1}
+
 
 class BotAdministration:
     def __init__(self, bot: AsyncTeleBot):
@@ -14,16 +26,17 @@ class BotAdministration:
         self.max_message_length = 4096
 
     async def get_chats_stats(self, msg: Message):
-        chat_counts = self.get_chat_counts()
+        chat_stats, computed_at = await admin_stats.get("chats")
         # Prepare formatted response data
         stats_data = {
-            "chat_today": chat_counts["today"],
-            "chat_week": chat_counts["this_week"],
-            "chat_month": chat_counts["this_month"],
-            "chat_year": chat_counts["this_year"],
-            "chat_all_time": chat_counts["all_time"],
-            "total_messages": self.get_total_messages(),
-            "stats_date": datetime.now(ZoneInfo("Asia/Tehran")).strftime("%Y/%d/%m - %H:%M:%S"),
+            "chat_today": chat_stats["today"],
+            "chat_week": chat_stats["this_week"],
+            "chat_month": chat_stats["this_month"],
+            "chat_year": chat_stats["this_year"],
+            "chat_all_time": chat_stats["all_time"],
+            "total_messages": chat_stats["total_messages"],
+            "messages_today": chat_stats["messages_today"],
+            "stats_date": self._format_stats_date(computed_at),
         }
 
         # Send the status message
@@ -34,14 +47,14 @@ class BotAdministration:
         )
 
     async def get_users_stats(self, msg: Message):
-        user_counts = self.get_users_count()
+        user_counts, computed_at = await admin_stats.get("users")
         stats_data = {
             "today": user_counts["today"],
             "week": user_counts["this_week"],
             "month": user_counts["this_month"],
             "year": user_counts["this_year"],
             "all_time": user_counts["all_time"],
-            "stats_date": datetime.now(ZoneInfo("Asia/Tehran")).strftime("%Y/%d/%m - %H:%M:%S"),
+            "stats_date": self._format_stats_date(computed_at),
         }
         # Send the status message
         await self.bot.send_message(
@@ -50,95 +63,191 @@ class BotAdministration:
             parse_mode="Markdown",
         )
 
+    async def get_users_growth_stats(self, msg: Message):
+        growth, computed_at = await admin_stats.get("users_growth")
+        rows = "\n".join(get_response("admin.stats.users_growth_row",
+                                      date=jdatetime.datetime.fromtimestamp(day_start, TEHRAN).strftime("%Y/%m/%d"),
+                                      count=count)
+                         for day_start, count in growth)
+        await self.bot.send_message(
+            msg.chat.id,
+            get_response("admin.stats.users_growth", days=len(growth), rows=rows,
+                         stats_date=self._format_stats_date(computed_at)),
+            parse_mode="Markdown",
+        )
+
     @staticmethod
-    def get_users_count():
-        # Get the current datetime and convert to UNIX timestamp
-        now = datetime.now()
-
-        # Calculate the start times as UNIX timestamps
-        start_today = datetime(now.year, now.month, now.day).timestamp()
-        start_week = (datetime(now.year, now.month, now.day) - timedelta(
-            days=now.weekday())).timestamp()  # Start of the current week (Monday)
-        start_month = datetime(now.year, now.month, 1).timestamp()  # First day of the current month
-        start_year = datetime(now.year, 1, 1).timestamp()  # First day of the current year
-
-        # Query the MongoDB collection to count users in each timeframe
-        all_time = users_collection.count_documents({})
-        today_count = users_collection.count_documents({"joined_at": {"$gte": start_today}})
-        week_count = users_collection.count_documents({"joined_at": {"$gte": start_week}})
-        month_count = users_collection.count_documents({"joined_at": {"$gte": start_month}})
-        year_count = users_collection.count_documents({"joined_at": {"$gte": start_year}})
-
-        return {
-            'all_time': all_time,
-            'today': today_count,
-            'this_week': week_count,
-            'this_month': month_count,
-            'this_year': year_count
-        }
+    def _format_stats_date(computed_at: float) -> str:
+        return datetime.fromtimestamp(computed_at, TEHRAN).strftime("%Y/%d/%m - %H:%M:%S")
 
     @staticmethod
-    def get_chat_counts():
-        # Current datetime
-        now = datetime.now()
-
-        # Define the start times for each period
-        start_of_today = datetime(now.year, now.month, now.day)
-        start_of_week = start_of_today - timedelta(days=start_of_today.weekday())
-        start_of_month = datetime(now.year, now.month, 1)
-        start_of_year = datetime(now.year, 1, 1)
-
-        # Convert the start times to timestamps
-        timestamp_today = start_of_today.timestamp()
-        timestamp_week = start_of_week.timestamp()
-        timestamp_month = start_of_month.timestamp()
-        timestamp_year = start_of_year.timestamp()
-
-        # Initialize counters
-        counts = {
-            'today': 0,
-            'this_week': 0,
-            'this_month': 0,
-            'this_year': 0,
-            'all_time': 0
-        }
+    async def compute_chats_stats() -> dict:
+        """Chat counts per period along with the message totals, as cached by admin_stats."""
+        chat_stats = dict((await stats_rollup.read())["chats"])
+        chat_stats["total_messages"] = await BotAdministration.get_total_messages()
+        chat_stats["messages_today"] = await count_metric("messages", BotAdministration._start_of_today())
+        return chat_stats
+
+    @staticmethod
+    async def compute_users_stats() -> dict:
+        """New users per period, as cached by admin_stats."""
+        return (await stats_rollup.read())["users"]
+
+    @staticmethod
+    def _start_of_today():
+        return period_starts()['today']
 
-        # Retrieve all user documents
-        user_documents = users_collection.find()
-
-        # Loop through each user document and count chats based on 'chat_created_at' timestamp
-        for user_doc in user_documents:
-            for chat in user_doc.get("chats", []):
-                chat_created_at = chat.get("chat_created_at")
-                if chat_created_at is not None:
-                    # Increment counts based on time periods
-                    counts['all_time'] += 1
-                    if chat_created_at >= timestamp_year:
-                        counts['this_year'] += 1
-                    if chat_created_at >= timestamp_month:
-                        counts['this_month'] += 1
-                    if chat_created_at >= timestamp_week:
-                        counts['this_week'] += 1
-                    if chat_created_at >= timestamp_today:
-                        counts['today'] += 1
+    @staticmethod
+    async def recount() -> dict:
+        """Full recount of new users and chats per period, used to reconcile the stats rollup."""
+        return {"users": await BotAdministration.get_users_count(),
+                "chats": await BotAdministration.get_chat_counts()}
 
+    @staticmethod
+    async def get_users_count():
+        # Calculate the start times (Tehran) as UNIX timestamps
+        starts = period_starts()
+        counts = await BotAdministration.count_joined({
+            'all_time': (None, None),
+            'today': (starts['today'], None),
+            'this_week': (starts['this_week'], None),
+            'this_month': (starts['this_month'], None),
+            'this_year': (starts['this_year'], None),
+        })
         return counts
 
     @staticmethod
-    def get_total_messages():
-        return bot_collection.find_one({"_id": "bot_config"}).get('total_messages', None)
-
-    async def get_ban_list(self, msg: Message):
-        # Get the ban list from the database
-        ban_list = bot_collection.find_one({"_id": "ban_list"}).get('banned_users', [])
-        # Prepare the response message
-        if len(ban_list) == 0:
-            await self.bot.send_message(msg.chat.id, get_response("admin.ban_list.empty"))
+    async def get_users_growth(days: int = GROWTH_DAYS) -> list:
+        """
+        New users per Tehran day over the last days, oldest first.
+        :return: [(day start as a UNIX timestamp, count), ...]
+        """
+        start_of_today = datetime.fromtimestamp(period_starts()['today'], TEHRAN)
+        day_starts = [(start_of_today - timedelta(days=days_ago)).timestamp() for days_ago in range(days - 1, -1, -1)]
+        day_ends = day_starts[1:] + [None]
+        counts = await BotAdministration.count_joined({str(i): (day_start, day_end) for i, (day_start, day_end)
+                                                       in enumerate(zip(day_starts, day_ends))})
+        return [(day_start, counts[str(i)]) for i, day_start in enumerate(day_starts)]
+
+    @staticmethod
+    async def count_joined(buckets: dict) -> dict:
+        """
+        Count the users that joined within each of several windows, in one aggregation.
+        :param buckets: {name: (start, end)} as UNIX timestamps, end excluded; None leaves that side open.
+        :return: {name: count}
+        """
+        group = {"_id": None}
+        for name, (start, end) in buckets.items():
+            conditions = []
+            if start is not None:
+                conditions.append({"$gte": ["$joined_at", start]})
+            if end is not None:
+                conditions.append({"$lt": ["$joined_at", end]})
+            group[name] = {"$sum": {"$cond": [{"$and": conditions}, 1, 0]}}
+        starts = [start for start, _ in buckets.values()]
+        pipeline = [{"$group": group}]
+        if None not in starts:
+            # Bounded windows only need the users in range, found through the joined_at index. An open
+            # window has to see every user, including ones without joined_at, so it reads the collection.
+            pipeline.insert(0, {"$match": {"joined_at": {"$gte": min(starts)}}})
+        result = await (await users_collection.aggregate(pipeline)).to_list()
+
+        counts = result[0] if result else {}
+        return {name: counts.get(name, 0) for name in buckets}
+
+    @staticmethod
+    async def get_chat_counts(start: float = None, end: float = None) -> dict:
+        """
+        Count chats created all time, this year, month, week and today in one aggregation.
+        :param start: Only count chats created at or after this UNIX timestamp.
+        :param end: Only count chats created before this UNIX timestamp.
+        :return: The five counts; with a range, each is limited to chats created within it.
+        """
+        created_at = {"$gte": start if start is not None else float("-inf")}
+        if end is not None:
+            created_at["$lt"] = end
+        # The range match walks the chat_created_at index and the group only reads that field
+        group = {"_id": None, "all_time": {"$sum": 1}}
+        for period, period_start in period_starts().items():
+            group[period] = {"$sum": {"$cond": [{"$gte": ["$chat_created_at", period_start]}, 1, 0]}}
+        result = await (await chats_collection.aggregate([
+            {"$match": {"chat_created_at": created_at}},
+            {"$group": group},
+        ])).to_list()
+
+        counts = result[0] if result else {}
+        return {period: counts.get(period, 0) for period in ['today', 'this_week', 'this_month', 'this_year',
+                                                             'all_time']}
+
+    @staticmethod
+    async def get_total_messages():
+        stored = (await bot_collection.find_one({"_id": "bot_config"}, {"total_messages": 1})).get('total_messages', 0)
+        # Include increments still waiting in the write-behind aggregator
+        return stored + bot_counters.pending("total_messages")
+
+    async def get_ban_list(self, msg: Message, after: int = None, before: int = None):
+        """
+        Show a page of banned users. The first page is sent as a new message; paging from its
+        buttons edits that message in place.
+        :param msg: The admin panel message, or the ban list message being paged.
+        :param after: Show the page following this user_id.
+        :param before: Show the page preceding this user_id.
+        """
+        paging = after is not None or before is not None
+        rows, has_prev, has_next = await self.get_banned_users_page(after, before)
+        if not rows and paging:
+            # The users around the cursor were unbanned meanwhile; start over
+            rows, has_prev, has_next = await self.get_banned_users_page()
+        if not rows:
+            if paging:
+                await self.bot.edit_message_text(get_response("admin.ban_list.empty"), msg.chat.id, msg.message_id)
+            else:
+                await self.bot.send_message(msg.chat.id, get_response("admin.ban_list.empty"))
             return
-        ban_list_str = "`\n`".join(map(str, ban_list))
-        header = get_response("admin.ban_list.list", ban_list="")  # Just to get the fixed part
-        max_chunk_size = self.max_message_length - len(header)
-        for i in range(0, len(ban_list_str), max_chunk_size):
-            chunk = ban_list_str[i:i + max_chunk_size]
-            response_message = get_response("admin.ban_list.list", ban_list=chunk)
-            await self.bot.send_message(msg.chat.id, response_message, parse_mode="Markdown")
+
+        text = get_response("admin.ban_list.list", total=await users_collection.count_documents({"is_banned": True}),
+                            rows="\n".join(get_response(
+                                "admin.ban_list.row",
+                                anon_id=user_data.get('id'),
+                                nickname=MessageValidator.escape_legacy_markdown(user_data.get('nickname') or '-'),
+                                banned_at=convert_timestamp_to_date(user_data['banned_at'], 'datetime')
+                                if user_data.get('banned_at') else '-',
+                                banned_by=user_data.get('banned_by') or '-',
+                            ) for user_data in rows))
+        markup = Keyboard().ban_list_buttons(rows[0]['user_id'], rows[-1]['user_id'], has_prev, has_next)
+        if paging:
+            await self.bot.edit_message_text(text, msg.chat.id, msg.message_id, parse_mode="Markdown",
+                                             reply_markup=markup)
+        else:
+            await self.bot.send_message(msg.chat.id, text, parse_mode="Markdown", reply_markup=markup)
+
+    @staticmethod
+    async def get_banned_users_page(after: int = None, before: int = None, page_size: int = None) -> tuple:
+        """
+        One page of banned users in user_id order, walking the banned_users partial index from a cursor
+        instead of skipping, so every page costs the same.
+        :param after: Return the users following this user_id, the first page when neither cursor is given.
+        :param before: Return the users preceding this user_id.
+        :param page_size: Users per page, BAN_LIST_PAGE_SIZE by default.
+        :return: (rows, has_prev, has_next)
+        """
+        page_size = page_size or BAN_LIST_PAGE_SIZE
+        query = {"is_banned": True}
+        if before is not None:
+            query["user_id"] = {"$lt": before}
+        elif after is not None:
+            query["user_id"] = {"$gt": after}
+        # One extra row tells whether another page follows in the walking direction
+        rows = await users_collection.find(query, BAN_LIST_VIEW).sort(
+            "user_id", -1 if before is not None else 1).limit(page_size + 1).to_list()
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if before is not None:
+            return rows[::-1], more, True
+        return rows, after is not None, more
+
+# Admin panel stats, answered from cache and refreshed in the background before they expire
+admin_stats = StatsService(ttl=config('ADMIN_STATS_TTL', default=60, cast=float))
+admin_stats.register("chats", BotAdministration.compute_chats_stats)
+admin_stats.register("users", BotAdministration.compute_users_stats)
+admin_stats.register("users_growth", BotAdministration.get_users_growth)
@@ -1,6 +1,7 @@
 from telebot.types import CallbackQuery
 
 from bot.admin.bot_administration import BotAdministration
+from bot.common.database_utils import is_admin
 
 
 class AdminCallbackHandler:
@@ -8,10 +9,20 @@ class AdminCallbackHandler:
         self.bot = bot
 
     async def handle_callback(self, callback: CallbackQuery):
-        callback_data = callback.data.split('-')[1:]
-        if 'chats_stats' in callback_data:
+        if not await is_admin(callback.from_user.id):
+            return
+        # CallbackHandler already stripped the "admin-" prefix, e.g. "ban_list-next-123"
+        action, *args = callback.data.split('-')
+        if action == 'chats_stats':
             await BotAdministration(self.bot).get_chats_stats(callback.message)
-        elif 'users_stats' in callback_data:
+        elif action == 'users_stats':
             await BotAdministration(self.bot).get_users_stats(callback.message)
-        elif 'ban_list' in callback_data:
-            await BotAdministration(self.bot).get_ban_list(callback.message)
+        elif action == 'users_growth':
+            await BotAdministration(self.bot).get_users_growth_stats(callback.message)
+        elif action == 'ban_list':
+            if len(args) == 2 and args[0] in ('next', 'prev') and args[1].isdigit():
+                direction, cursor = args
+                await BotAdministration(self.bot).get_ban_list(callback.message, **{
+                    "after" if direction == 'next' else "before": int(cursor)})
+            else:
+                await BotAdministration(self.bot).get_ban_list(callback.message)
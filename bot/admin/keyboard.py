@@ -11,9 +11,27 @@ class Keyboard(KeyboardMarkupGenerator):
                 InlineKeyboardButton('💬 آمار چت ها', callback_data='admin-chats_stats'),
                 InlineKeyboardButton('👥 آمار کاربران', callback_data='admin-users_stats')
             ],
+            [
+                InlineKeyboardButton('📈 رشد کاربران', callback_data='admin-users_growth'),
+            ],
             [
                 InlineKeyboardButton('❌ بن لیست', callback_data='admin-ban_list'),
             ]
         ]
 
         return self._create_list_inline_keyboard(buttons)
+
+    def ban_list_buttons(self, first_user_id: int, last_user_id: int, has_prev: bool, has_next: bool):
+        """
+        Ban list page navigation; the buttons carry the page's first and last user id as cursors.
+        :param first_user_id: user_id of the first row on the page
+        :param last_user_id: user_id of the last row on the page
+        :param has_prev: show the previous page button
+        :param has_next: show the next page button
+        """
+        buttons = []
+        if has_prev:
+            buttons.append(InlineKeyboardButton('➡️ قبلی', callback_data=f'admin-ban_list-prev-{first_user_id}'))
+        if has_next:
+            buttons.append(InlineKeyboardButton('بعدی ⬅️', callback_data=f'admin-ban_list-next-{last_user_id}'))
+        return self._create_list_inline_keyboard([buttons])
@@ -7,7 +7,9 @@ from datetime import datetime
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
-from bot.common.database_utils import get_admins, is_admin, update_ban_list, update_user_fields
+from bot.common.block_utils import count_blocks
+from bot.common.chat_utils import count_user_chats
+from bot.common.database_utils import get_admins, is_admin, update_ban_list
 from bot.database.database import users_collection
 from bot.common.date import convert_timestamp_to_date
 from bot.languages.response import get_response
@@ -25,23 +27,23 @@ class UserAdministration:
         :param msg: Message object containing the command and user_anon_id.
         """
         user_id = msg.from_user.id
-        if not is_admin(user_id):
+        if not await is_admin(user_id):
             return
         parts = msg.text.split()
         if not len(parts) == 2:
             await self.bot.send_message(user_id, get_response('admin.errors.info.wrong_format'))
 
         user_anon_id = parts[1]
-        user_info = users_collection.find_one({"id": user_anon_id})
+        user_info = await users_collection.find_one({"id": user_anon_id})
         if not user_info:
             # If user_anon_id is not found, check if it's a user_id
-            user_info = users_collection.find_one({"user_id": int(user_anon_id)})
+            user_info = await users_collection.find_one({"user_id": int(user_anon_id)})
         if not user_info:
             await self.bot.send_message(user_id, get_response('admin.errors.info.not_found'))
             return
         joined_at = convert_timestamp_to_date(user_info['joined_at'])
-        chats_count = self._get_chats_count(user_info['chats'])
-        blocks_count = self._get_blocks_count(user_info['blocklist'])
+        chats_count = await count_user_chats(user_info['user_id'])
+        blocks_count = await count_blocks(user_info['id'])
 
         username = user_info['username']
         first_name = user_info['first_name']
@@ -61,7 +63,7 @@ class UserAdministration:
             "banned_by": user_info.get('banned_by'),
             "banned_at": user_info.get('banned_at'),
             "is_bot_off": user_info.get('is_bot_off'),
-            "is_admin": is_admin(user_info['user_id']),
+            "is_admin": await is_admin(user_info['user_id']),
         }
 
         await self.bot.send_message(user_id, get_response('admin.user.info', **user_data)
@@ -74,7 +76,7 @@ class UserAdministration:
         """
 
         user_id = msg.from_user.id
-        if not is_admin(user_id):
+        if not await is_admin(user_id):
             await self.bot.send_message(user_id, get_response('errors.no_active_chat'))
             return
         parts = msg.text.split()
@@ -84,7 +86,7 @@ class UserAdministration:
             return
 
         user_anon_id = parts[1]
-        user_info = users_collection.find_one({"id": user_anon_id})
+        user_info = await users_collection.find_one({"id": user_anon_id})
         if not user_info:
             await self.bot.send_message(user_id,
                                         get_response('admin.errors.ban.not_found'))
@@ -92,13 +94,13 @@ class UserAdministration:
             await self.bot.send_message(user_id,
                                         get_response('admin.errors.ban.already_banned'))
             return
-        if is_admin(user_info['user_id']):
+        if await is_admin(user_info['user_id']):
             await self.bot.send_message(user_id, get_response('admin.errors.ban.admin_ban'))
             return
-        await update_user_fields(user_info['user_id'], {"is_banned": True,
-                                                    "banned_by": user_id,
-                                                   "banned_at": datetime.timestamp(datetime.now())})
-        await update_ban_list(user_info['user_id'], 'ban')
+        if not await update_ban_list(user_info['user_id'], 'ban', banned_by=user_id):
+            await self.bot.send_message(user_id,
+                                        get_response('admin.errors.ban.already_banned'))
+            return
         response_info = {
             'user_id': user_info['user_id'],
             'anon_id': user_anon_id,
@@ -125,7 +127,7 @@ class UserAdministration:
         :param msg: Message object containing the command and user_anon_id.
         """
         admin_user_id = msg.from_user.id
-        if not is_admin(admin_user_id):
+        if not await is_admin(admin_user_id):
             await self.bot.send_message(admin_user_id,
                                         get_response('errors.no_active_chat'))
             return
@@ -135,7 +137,7 @@ class UserAdministration:
                                         get_response('admin.errors.unban.wrong_format'))
 
         user_anon_id = parts[1]
-        user_info = users_collection.find_one({"id": user_anon_id})
+        user_info = await users_collection.find_one({"id": user_anon_id})
         if not user_info:
             await self.bot.send_message(admin_user_id, get_response('admin.errors.unban.not_found'))
             return
@@ -143,9 +145,10 @@ class UserAdministration:
             await self.bot.send_message(admin_user_id,
                                         get_response('admin.errors.unban.not_banned'))
             return
-        await update_user_fields(user_info['user_id'], {"is_banned": False, "banned_by": None,
-                                                   "banned_at": None})
-        await update_ban_list(user_info['user_id'], 'unban')
+        if not await update_ban_list(user_info['user_id'], 'unban'):
+            await self.bot.send_message(admin_user_id,
+                                        get_response('admin.errors.unban.not_banned'))
+            return
         response_info = {
             'user_id': user_info['user_id'],
             'anon_id': user_anon_id,
@@ -166,12 +169,3 @@ class UserAdministration:
             )
         await self.bot.send_message(user_info.get('user_id'), get_response('account.ban.unbanned'),
                                     parse_mode='Markdown')
-
-    @staticmethod
-    def _get_chats_count(chats):
-        chats_count = [chat for chat in chats]
-        return len(chats_count)
-
-    @staticmethod
-    def _get_blocks_count(blocks):
-        return len(blocks)
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from decouple import config
+
+from bot.database.database import bot_collection
+
+
+class AdminRoster:
+    """
+    The admin user ids from bot_config, cached for a short TTL.
+    Membership checks and iteration are served from memory; the roster is re-read when it
+    expires or after update_bot_fields changes the admin field.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._admins = frozenset()
+        self._order = []
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._expires_at = 0.0
+
+    async def _ensure_fresh(self) -> None:
+        if self._expires_at > time.monotonic():
+            return
+        async with self._lock:
+            if self._expires_at > time.monotonic():
+                return  # Refreshed by another update while we waited
+            generation = self._generation
+            bot_config = await bot_collection.find_one({"_id": "bot_config"}, {"admin": 1})
+            self._order = list((bot_config or {}).get('admin', []))
+            self._admins = frozenset(self._order)
+            # Invalidated during the read: serve what was read, but re-read on the next check
+            if generation == self._generation:
+                self._expires_at = time.monotonic() + self.ttl
+
+    async def is_admin(self, user_id: int) -> bool:
+        await self._ensure_fresh()
+        return user_id in self._admins
+
+    async def members(self) -> list:
+        """Return the admin ids in their stored order."""
+        await self._ensure_fresh()
+        return list(self._order)
+
+
+admin_roster = AdminRoster(ttl=config('ADMIN_ROSTER_TTL', default=60, cast=float))
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from pymongo.errors import PyMongoError
+
+from bot.database.database import users_collection, bot_collection
+
+logger = logging.getLogger(__name__)
+
+# The single document that used to hold every banned user id, before bans lived on the user documents
+LEGACY_BAN_LIST_ID = "ban_list"
+
+
+class BanRegistry:
+    """
+    The banned user ids, held in memory so ban checks never touch the database.
+    The is_banned field of each user document is the only source of truth: the registry is loaded
+    from the banned_users partial index at startup and kept fresh through a change stream on the users
+    collection, or by reloading from the index periodically when change streams aren't available
+    (standalone servers).
+    """
+
+    def __init__(self):
+        self._banned = set()
+
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self._banned
+
+    def add(self, user_id: int) -> None:
+        self._banned.add(user_id)
+
+    def remove(self, user_id: int) -> None:
+        self._banned.discard(user_id)
+
+    @staticmethod
+    async def _fetch() -> set:
+        # Covered by the banned_users partial index, which only holds banned users
+        cursor = users_collection.find({"is_banned": True}, {"_id": 0, "user_id": 1})
+        return {user_data['user_id'] async for user_data in cursor}
+
+    async def load(self) -> None:
+        """Load the banned users."""
+        self._banned = await self._fetch()
+        logger.info("Loaded %s banned users", len(self._banned))
+
+    async def watch(self, poll_interval: float = 30.0) -> None:
+        """Follow bans and unbans made by other processes until cancelled."""
+        try:
+            async with await users_collection.watch([{"$match": {"$or": [
+                {"updateDescription.updatedFields.is_banned": {"$exists": True}},
+                {"operationType": {"$in": ["insert", "replace"]}, "fullDocument.is_banned": True},
+            ]}}], full_document="updateLookup") as stream:
+                async for change in stream:
+                    user_data = change.get('fullDocument')
+                    if not user_data:
+                        continue
+                    if user_data.get('is_banned'):
+                        self.add(user_data['user_id'])
+                    else:
+                        self.remove(user_data['user_id'])
+        except PyMongoError as e:
+            logger.info("Users change stream unavailable (%s), reloading bans every %ss", e, poll_interval)
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                self._banned = await self._fetch()
+            except PyMongoError as e:
+                logger.warning("Failed to reload the banned users: %s", e)
+
+
+async def migrate_ban_list() -> int:
+    """
+    One-time move of the legacy ban_list document onto the users' own ban records, after which the
+    document is dropped. Run before the registry loads; does nothing once the document is gone.
+    :return: Number of users marked as banned by the migration.
+    """
+    ban_list = await bot_collection.find_one({"_id": LEGACY_BAN_LIST_ID}, {"banned_users": 1})
+    if ban_list is None:
+        return 0
+    user_ids = [int(user_id) for user_id in ban_list.get('banned_users', [])]
+    migrated = 0
+    if user_ids:
+        result = await users_collection.update_many({"user_id": {"$in": user_ids}, "is_banned": {"$ne": True}},
+                                                    {"$set": {"is_banned": True}})
+        migrated = result.modified_count
+    await bot_collection.delete_one({"_id": LEGACY_BAN_LIST_ID})
+    logger.info("Migrated the legacy ban list: %s users, %s newly marked as banned", len(user_ids), migrated)
+    return migrated
+
+
+ban_registry = BanRegistry()
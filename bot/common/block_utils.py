@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from bot.database.database import users_collection, blocks_collection
+from bot.database.migrations import run_batched_migration
+
+# Cleared once every legacy blocklist array has been moved into the blocks collection
+_legacy_blocklists_pending = True
+
+
+async def add_block(blocker_anon_id: str, blocked_anon_id: str) -> bool:
+    """
+    Record that blocker has blocked the other user.
+    :param blocker_anon_id: Anonymous ID of the blocker.
+    :param blocked_anon_id: Anonymous ID of the blocked user.
+    :return: True if the block is new, False if it already existed.
+    """
+    result = await blocks_collection.update_one(
+        {"blocker": blocker_anon_id, "blocked": blocked_anon_id},
+        {"$setOnInsert": {"blocked_at": datetime.timestamp(datetime.now())}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+
+async def remove_block(blocker_anon_id: str, blocked_anon_id: str) -> None:
+    """Remove a block edge."""
+    await blocks_collection.delete_one({"blocker": blocker_anon_id, "blocked": blocked_anon_id})
+    if _legacy_blocklists_pending:
+        # Keep the migration from bringing the block back
+        await users_collection.update_one({"id": blocker_anon_id, "blocklist": blocked_anon_id},
+                                          {"$pull": {"blocklist": blocked_anon_id}})
+
+
+async def get_blocklist(blocker_anon_id: str) -> list:
+    """
+    Retrieve the anonymous IDs blocked by a user, oldest first.
+    :param blocker_anon_id: Anonymous ID of the blocker.
+    """
+    cursor = blocks_collection.find({"blocker": blocker_anon_id}, {"_id": 0, "blocked": 1}).sort("blocked_at", 1)
+    blocklist = [edge['blocked'] async for edge in cursor]
+    if _legacy_blocklists_pending:
+        legacy = await users_collection.find_one({"id": blocker_anon_id}, {"_id": 0, "blocklist": 1})
+        blocklist += [blocked for blocked in (legacy or {}).get('blocklist', []) if blocked not in blocklist]
+    return blocklist
+
+
+async def count_blocks(blocker_anon_id: str) -> int:
+    """Count the users blocked by a user."""
+    if _legacy_blocklists_pending:
+        return len(await get_blocklist(blocker_anon_id))
+    return await blocks_collection.count_documents({"blocker": blocker_anon_id})
+
+
+async def is_blocked(first_anon_id: str, second_anon_id: str) -> bool:
+    """
+    Check if either user has blocked the other with one query over the (blocker, blocked) index.
+    :param first_anon_id: Anonymous ID of one user.
+    :param second_anon_id: Anonymous ID of the other user.
+    :return: True if a block exists in either direction, False otherwise.
+    """
+    edge = await blocks_collection.find_one({"$or": [
+        {"blocker": first_anon_id, "blocked": second_anon_id},
+        {"blocker": second_anon_id, "blocked": first_anon_id},
+    ]}, {"_id": 1})
+    if edge:
+        return True
+    if _legacy_blocklists_pending:
+        # Users not migrated yet still keep their blocks in the embedded array
+        legacy = await users_collection.find_one({"$or": [
+            {"id": first_anon_id, "blocklist": second_anon_id},
+            {"id": second_anon_id, "blocklist": first_anon_id},
+        ]}, {"_id": 1})
+        return legacy is not None
+    return False
+
+
+async def migrate_blocklists(batch_size: int = 100, pause: float = 0.1) -> int:
+    """
+    Background migration of the legacy blocklist arrays into the blocks collection.
+    :return: Number of migrated users.
+    """
+    global _legacy_blocklists_pending
+
+    async def migrate_batch(batch: list) -> None:
+        for user_data in batch:
+            operations = [
+                UpdateOne({"blocker": user_data['id'], "blocked": blocked_anon_id},
+                          {"$setOnInsert": {"blocked_at": datetime.timestamp(datetime.now())}}, upsert=True)
+                for blocked_anon_id in set(user_data.get('blocklist') or [])
+            ]
+            if operations:
+                await blocks_collection.bulk_write(operations, ordered=False)
+            await users_collection.update_one({"user_id": user_data['user_id']}, {"$unset": {"blocklist": ""}})
+
+    migrated = await run_batched_migration("blocklists", users_collection, {"blocklist": {"$exists": True}},
+                                           {"user_id": 1, "id": 1, "blocklist": 1}, migrate_batch, batch_size, pause)
+    _legacy_blocklists_pending = False
+    return migrated
@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with LRU eviction and a per-entry time to live.
+    Hit, miss, eviction and expiration counters are kept so the size can be tuned
+    against the active set.
+
+    A value loaded from the database while its key is invalidated would otherwise be cached stale:
+    take generation(key) before loading and pass it to set(), which then skips the value if the key
+    was invalidated meanwhile.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> invalidation number, for the maxsize most recently invalidated keys; keys whose record
+        # was dropped report the highest dropped number, which can only make set() skip more often
+        self._generations = OrderedDict()
+        self._invalidations = 0
+        self._dropped_generation = 0
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self, key) -> int:
+        """Return the key's current generation, which changes every time the key is invalidated."""
+        return self._generations.get(key, self._dropped_generation)
+
+    def set(self, key, value, generation: int = None) -> None:
+        """
+        Store a value, evicting the least recently used entries beyond maxsize.
+        :param generation: generation(key) taken before the value was loaded; the value is skipped
+        if the key was invalidated since.
+        """
+        if generation is not None and generation != self.generation(key):
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        """Drop a key, if cached, and move it to a new generation."""
+        self._data.pop(key, None)
+        self._invalidations += 1
+        self._generations[key] = self._invalidations
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.maxsize:
+            _, dropped = self._generations.popitem(last=False)
+            self._dropped_generation = max(self._dropped_generation, dropped)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Return the cache counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
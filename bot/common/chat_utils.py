@@ -1,55 +1,212 @@
-from bot.database.database import users_collection
+from datetime import datetime, timezone
 
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
 
-def close_chats(user_id: int, reset_replying: bool = False) -> None:
+from bot.common.conversation import conversation_states
+from bot.common.state_utils import REPLY_RESET, get_state
+from bot.database.database import users_collection, chats_collection, seen_collection
+from bot.database.migrations import run_batched_migration
+
+# Cleared once every legacy embedded chats array has been moved into the chats collection
+_legacy_chats_pending = True
+
+
+async def close_chats(user_id: int, reset_replying: bool = False) -> int:
     """
-    Close all open chats for a user and optionally reset the replying state.
+    Close the user's open chat and optionally reset the replying state.
     :param user_id: User ID.
     :param reset_replying: Whether to reset replying state.
+    :return: Number of chats closed.
     """
-    update_fields = {"chats.$[].open": False}
-    if reset_replying:
-        update_fields.update({"replying": False, "reply_target_message_id": "", "reply_target_user_id": ""})
+    state = get_state(user_id)
+    closed = int(state.open_chat_target_id is not None)
+    fields = {"open_chat_target_id": None, "open_chat_target_anon_id": None} if closed else {}
+    if reset_replying and state.replying:
+        fields.update(REPLY_RESET)
+    if fields:
+        conversation_states.update(user_id, **fields)
+    return closed
 
-    users_collection.update_one({"user_id": user_id}, {"$set": update_fields})
+
+async def get_open_chat(user_id: int) -> dict | None:
+    """
+    Retrieve the user's currently open chat from the conversation state.
+    :param user_id: User ID of the chat owner.
+    :return: Chat owner and target, or None if no chat is open.
+    """
+    state = get_state(user_id)
+    if state.open_chat_target_id is None:
+        return None
+    return {"owner_id": user_id, "target_user_id": state.open_chat_target_id,
+            "target_user_anon_id": state.open_chat_target_anon_id}
 
 
-def add_seen_message(user_id, message_id: int):
+async def create_chat(user_id: int, target_user_id: int, target_user_anon_id: str) -> bool:
     """
-    Adds a message ID to the seen_messages array for a specific user.
-    :param user_id: The ID of the user
-    :param message_id: The ID of the message to mark as seen
+    Record a chat owned by user_id with the target user, without opening it.
+    :param user_id: User ID of the chat owner.
+    :param target_user_id: User ID of the other side.
+    :param target_user_anon_id: Anonymous ID of the other side.
+    :return: True if the chat was created, False if it already existed.
     """
-    users_collection.update_one(
+    now = datetime.timestamp(datetime.now())
+    result = await chats_collection.update_one(
+        {"owner_id": user_id, "target_user_id": target_user_id},
         {
-            "user_id": user_id
+            "$setOnInsert": {
+                "target_user_anon_id": target_user_anon_id,
+                "chat_created_at": now,
+                "chat_started_at": now,
+            },
         },
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+
+async def open_chat(user_id: int, target_user_id: int, target_user_anon_id: str) -> dict:
+    """
+    Open the user's chat with a target user, creating it if there's none yet, in one atomic upsert.
+    The chat becomes the user's open chat in the conversation state.
+    :param user_id: User ID of the chat owner.
+    :param target_user_id: User ID of the other side.
+    :param target_user_anon_id: Anonymous ID of the other side.
+    :return: The chat after the update; a chat created by this call has chat_created_at == chat_started_at.
+    """
+    now = datetime.timestamp(datetime.now())
+    chat = await chats_collection.find_one_and_update(
+        {"owner_id": user_id, "target_user_id": target_user_id},
         {
-            "$addToSet": {
-                "seen_messages": int(message_id)
-            }
-        }
+            "$set": {"chat_started_at": now},
+            "$setOnInsert": {"target_user_anon_id": target_user_anon_id, "chat_created_at": now},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    conversation_states.update(user_id, open_chat_target_id=target_user_id,
+                               open_chat_target_anon_id=target_user_anon_id)
+    return chat
+
+
+async def count_user_chats(user_id: int) -> int:
+    """Count the chats owned by a user."""
+    return await chats_collection.count_documents({"owner_id": user_id})
+
+
+def with_legacy_chats(projection: dict) -> dict:
+    """
+    Add the legacy chats array to a user projection while the embedded chats migration is pending,
+    so ensure_chats_migrated can move it on read. Afterwards the projection is left as is, and stays
+    servable from the user cache.
+    """
+    if _legacy_chats_pending:
+        return {**projection, "chats": 1}
+    return projection
+
+
+async def ensure_chats_migrated(user_data: dict) -> None:
+    """
+    Move a user's legacy embedded chats array into the chats collection, if it still has one.
+    The array is dropped from user_data so callers can keep using the document.
+    :param user_data: User document fetched with the chats field.
+    """
+    if 'chats' in user_data:
+        await migrate_user_chats(user_data['user_id'], user_data.pop('chats') or [])
+
+
+async def migrate_user_chats(user_id: int, chats: list) -> None:
+    """
+    Copy embedded chats into the chats collection and unset the array on the user document.
+    Idempotent: chats already present in the collection are left untouched.
+    An open legacy chat becomes the user's open chat, unless the user opened one since.
+    """
+    operations = [
+        UpdateOne(
+            {"owner_id": user_id, "target_user_id": chat['target_user_id']},
+            {"$setOnInsert": {
+                "target_user_anon_id": chat.get('target_user_anon_id') or chat.get('target_user_bot_id'),
+                "chat_created_at": chat.get('chat_created_at'),
+                "chat_started_at": chat.get('chat_started_at'),
+            }},
+            upsert=True
+        )
+        for chat in chats if chat.get('target_user_id') is not None
+    ]
+    if operations:
+        try:
+            await chats_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate targets in the legacy array race on the unique index; anything else is real
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+    open_chats = [chat for chat in chats if chat.get('open') and chat.get('target_user_id') is not None]
+    if open_chats and get_state(user_id).open_chat_target_id is None:
+        conversation_states.update(user_id, open_chat_target_id=open_chats[0]['target_user_id'],
+                                   open_chat_target_anon_id=open_chats[0].get('target_user_anon_id')
+                                   or open_chats[0].get('target_user_bot_id'))
+    await users_collection.update_one({"user_id": user_id}, {"$unset": {"chats": ""}})
+
+
+async def migrate_embedded_chats(batch_size: int = 100, pause: float = 0.1) -> int:
+    """
+    Background migration of every user still carrying an embedded chats array.
+    :return: Number of migrated users.
+    """
+    global _legacy_chats_pending
+
+    async def migrate_batch(batch: list) -> None:
+        for user_data in batch:
+            await migrate_user_chats(user_data['user_id'], user_data.get('chats') or [])
+
+    migrated = await run_batched_migration("embedded_chats", users_collection, {"chats": {"$exists": True}},
+                                           {"user_id": 1, "chats": 1}, migrate_batch, batch_size, pause)
+    _legacy_chats_pending = False
+    return migrated
+
+
+async def add_seen_message(user_id, message_id: int):
+    """
+    Records a seen receipt for a message of a specific user.
+    :param user_id: The ID of the user
+    :param message_id: The ID of the message to mark as seen
+    """
+    await seen_collection.update_one(
+        {"user_id": user_id, "message_id": int(message_id)},
+        {"$setOnInsert": {"seen_at": datetime.now(timezone.utc)}},
+        upsert=True
     )
 
 
-def get_seen_status(user_id, message_id: int):
+async def get_seen_status(user_id, message_id: int):
     """
-    Retrieve the seen status for the message from the user's document
+    Retrieve the seen status for the message from the seen receipts
     :param user_id: User ID of requester
     :param message_id: Message ID to check the seen status
     :return: Boolean indicating whether the message has been seen
     """
-    # Query the database to get the 'seen_messages' for the user
-    user_data = users_collection.find_one(
-        {"user_id": user_id}
-    )
+    receipt = await seen_collection.find_one({"user_id": user_id, "message_id": int(message_id)}, {"_id": 1})
+    return receipt is not None
 
-    # Check if the 'seen_messages' array contains the given message_id
-    if user_data:
-        return int(message_id) in user_data.get('seen_messages', [])
 
-    # If no data is found, assume the message has not been seen
-    return False
+async def migrate_seen_messages(batch_size: int = 100, pause: float = 0.1) -> int:
+    """
+    Background migration of the legacy seen_messages arrays into the seen receipts collection.
+    :return: Number of migrated users.
+    """
+    async def migrate_batch(batch: list) -> None:
+        for user_data in batch:
+            operations = [
+                UpdateOne({"user_id": user_data['user_id'], "message_id": int(message_id)},
+                          {"$setOnInsert": {"seen_at": datetime.now(timezone.utc)}}, upsert=True)
+                for message_id in set(user_data.get('seen_messages') or [])
+            ]
+            if operations:
+                await seen_collection.bulk_write(operations, ordered=False)
+            await users_collection.update_one({"user_id": user_data['user_id']}, {"$unset": {"seen_messages": ""}})
+
+    return await run_batched_migration("seen_messages", users_collection, {"seen_messages": {"$exists": True}},
+                                       {"user_id": 1, "seen_messages": 1}, migrate_batch, batch_size, pause)
 
 
 def get_marked_status(text: str):
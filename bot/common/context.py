@@ -0,0 +1,82 @@
+from bot.common.bans import ban_registry
+from bot.common.block_utils import is_blocked
+from bot.common.chat_utils import ensure_chats_migrated, get_open_chat, with_legacy_chats
+from bot.common.conversation import ConversationState
+from bot.common.database_utils import fetch_user_data_by_id, fetch_user_data_by_query, combine_views, \
+    IDENTITY_VIEW, FLAGS_VIEW
+from bot.common.state_utils import get_state
+from bot.common.unit_of_work import UnitOfWork
+
+SENDER_VIEW = FLAGS_VIEW
+RECIPIENT_VIEW = combine_views(IDENTITY_VIEW, FLAGS_VIEW)
+
+
+class UpdateContext:
+    """
+    User documents loaded once per update and shared by every check made while handling it.
+    The sender is fetched when the context is loaded, the recipient and open chat only when a flow needs them.
+    The sender's conversation state is read from the state store, not the user document.
+    Writes to user documents made while handling the update are queued on uow and committed together.
+    """
+
+    def __init__(self, user: dict | None, state: ConversationState = None):
+        self.user = user
+        self.state = state or ConversationState()
+        self.recipient = None
+        self.open_chat = None
+        self.uow = UnitOfWork()
+
+    @classmethod
+    async def load(cls, user_id: int) -> 'UpdateContext':
+        """
+        Load the sender's document.
+        :param user_id: User ID of the sender.
+        """
+        ctx = cls(await fetch_user_data_by_id(user_id, with_legacy_chats(SENDER_VIEW)))
+        if ctx.user:
+            await ensure_chats_migrated(ctx.user)
+            ctx.state = get_state(user_id)
+        return ctx
+
+    async def load_recipient(self, query: dict) -> dict | None:
+        """
+        Load the recipient's document, e.g. {"user_id": ...} or {"id": anon_id}.
+        :param query: Query matching the recipient.
+        :return: The recipient document or None if not found.
+        """
+        self.recipient = await fetch_user_data_by_query(query, RECIPIENT_VIEW)
+        return self.recipient
+
+    async def load_open_chat(self) -> dict | None:
+        """
+        Load the sender's open chat from the conversation state.
+        :return: The chat owner and target, or None if no chat is open.
+        """
+        self.open_chat = await get_open_chat(self.user_id)
+        return self.open_chat
+
+    @property
+    def user_id(self) -> int | None:
+        return self.user.get('user_id') if self.user else None
+
+    @property
+    def anon_id(self) -> str | None:
+        return self.user.get('id') if self.user else None
+
+    @property
+    def is_banned(self) -> bool:
+        return bool(self.user) and ban_registry.is_banned(self.user_id)
+
+    @property
+    def is_bot_off(self) -> bool:
+        return bool(self.user and self.user.get('is_bot_off', False))
+
+    @property
+    def is_recipient_bot_off(self) -> bool:
+        return bool(self.recipient and self.recipient.get('is_bot_off', False))
+
+    async def is_blocked(self) -> bool:
+        """Check if the sender and the loaded recipient have blocked each other in either direction."""
+        if not self.user or not self.recipient:
+            return False  # If data is missing, assume not blocked
+        return await is_blocked(self.anon_id, self.recipient['id'])
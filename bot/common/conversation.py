@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from decouple import config
+import pymongo
+from pymongo import ReplaceOne, DeleteOne
+
+from bot.database.database import states_collection
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationState:
+    """
+    Short-lived conversation state of one user: the message being replied to, the open chat,
+    and whether the next message is a nickname or an edit.
+    """
+
+    __slots__ = ("replying", "reply_target_message_id", "reply_target_user_id", "awaiting_nickname",
+                 "editing_prompt_message_id", "editing_target_message_id", "editing_target_anon_id",
+                 "open_chat_target_id", "open_chat_target_anon_id", "updated_at")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, **fields):
+        self.replying = False
+        self.reply_target_message_id = ""
+        self.reply_target_user_id = ""
+        self.awaiting_nickname = False
+        self.editing_prompt_message_id = 0
+        self.editing_target_message_id = 0
+        self.editing_target_anon_id = ""
+        self.open_chat_target_id = None
+        self.open_chat_target_anon_id = None
+        self.updated_at = time.time()
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    def is_idle(self) -> bool:
+        """True when the user isn't in any state worth keeping."""
+        return not (self.replying or self.awaiting_nickname or self.editing_prompt_message_id
+                    or self.open_chat_target_id is not None)
+
+    def copy(self) -> 'ConversationState':
+        return ConversationState(**{field: getattr(self, field) for field in self.__slots__})
+
+    def to_document(self, user_id: int) -> dict:
+        document = {field: getattr(self, field) for field in self.FIELDS}
+        document.update({"_id": user_id, "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc)})
+        return document
+
+    @classmethod
+    def from_document(cls, document: dict) -> 'ConversationState':
+        fields = {field: document[field] for field in cls.FIELDS if field in document}
+        updated_at = document.get('updated_at')
+        if isinstance(updated_at, datetime):
+            fields['updated_at'] = updated_at.replace(tzinfo=updated_at.tzinfo or timezone.utc).timestamp()
+        return cls(**fields)
+
+
+class ConversationStateStore:
+    """
+    In-memory primary for every user's conversation state, so reading and changing it costs no round trip.
+    Changed records are snapshotted to the states collection periodically and on shutdown, and loaded back
+    at startup; at most one snapshot interval of changes is lost on a crash. States untouched for longer than
+    ttl expire, in memory and, through a TTL index, in the snapshots.
+
+    The bot runs as a single process, which makes this store the only writer of the state.
+    """
+
+    def __init__(self, collection, ttl: float = 86400.0, snapshot_interval: float = 10.0):
+        self.collection = collection
+        self.ttl = ttl
+        self.snapshot_interval = snapshot_interval
+        self._states = {}
+        self._dirty = set()
+        self._lock = asyncio.Lock()
+
+    def get(self, user_id: int) -> ConversationState:
+        """Return a copy of the user's state; a user without one gets the idle state."""
+        state = self._states.get(user_id)
+        if state is None:
+            return ConversationState()
+        if state.updated_at + self.ttl < time.time():
+            self._drop(user_id)
+            return ConversationState()
+        return state.copy()
+
+    def update(self, user_id: int, **fields) -> ConversationState:
+        """
+        Change some of the user's state fields.
+        :return: A copy of the state after the change.
+        """
+        state = self._states.get(user_id) or ConversationState()
+        for field, value in fields.items():
+            if field not in ConversationState.FIELDS:
+                raise AttributeError(f"Unknown conversation state field: {field}")
+            setattr(state, field, value)
+        state.updated_at = time.time()
+        if state.is_idle():
+            self._drop(user_id)
+        else:
+            self._states[user_id] = state
+            self._dirty.add(user_id)
+        return state.copy()
+
+    def _drop(self, user_id: int) -> None:
+        if self._states.pop(user_id, None) is not None:
+            self._dirty.add(user_id)
+
+    def expire(self) -> int:
+        """Drop every state older than ttl; returns how many were dropped."""
+        deadline = time.time() - self.ttl
+        expired = [user_id for user_id, state in self._states.items() if state.updated_at < deadline]
+        for user_id in expired:
+            self._drop(user_id)
+        return len(expired)
+
+    async def load(self) -> None:
+        """Load the last snapshot, skipping the states that expired meanwhile."""
+        deadline = time.time() - self.ttl
+        async for document in self.collection.find({}):
+            state = ConversationState.from_document(document)
+            if state.updated_at >= deadline and not state.is_idle():
+                self._states[document['_id']] = state
+        logger.info("Loaded %s conversation states", len(self._states))
+
+    async def snapshot(self) -> None:
+        """Write the records changed since the last snapshot; failed ones are retried on the next."""
+        async with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return
+            operations = [ReplaceOne({"_id": user_id}, self._states[user_id].to_document(user_id), upsert=True)
+                          if user_id in self._states else DeleteOne({"_id": user_id})
+                          for user_id in dirty]
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except pymongo.errors.PyMongoError as e:
+                logger.error("Failed to snapshot %s conversation states: %s", len(dirty), e)
+                self._dirty |= dirty
+
+    async def run(self) -> None:
+        """Expire stale states and snapshot periodically until cancelled."""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self.expire()
+            await self.snapshot()
+
+    async def close(self) -> None:
+        """Snapshot whatever changed, e.g. on shutdown."""
+        await self.snapshot()
+
+
+conversation_states = ConversationStateStore(
+    states_collection,
+    ttl=config('CONVERSATION_STATE_TTL', default=86400, cast=float),
+    snapshot_interval=config('CONVERSATION_SNAPSHOT_INTERVAL', default=10, cast=float),
+)
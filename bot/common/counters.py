@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from decouple import config
+import pymongo
+
+from bot.common.tasks import create_background_task
+from bot.database.database import bot_collection
+
+logger = logging.getLogger(__name__)
+
+
+class CounterAggregator:
+    """
+    Write-behind aggregator for global counters.
+    Increments are kept in memory and flushed as one $inc per document, periodically,
+    when the pending total reaches a threshold, and on shutdown. At most one flush interval
+    (or threshold) worth of increments can be lost on a crash.
+    """
+
+    def __init__(self, collection, flush_interval: float = 5.0, flush_threshold: int = 100):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._pending_total = 0
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+
+    def increment(self, field: str, count: int = 1, document_id: str = "bot_config") -> None:
+        """
+        Add to a counter without touching the database.
+        :param field: Counter field to increment.
+        :param count: Amount to add.
+        :param document_id: _id of the document holding the counter.
+        """
+        self._add(document_id, field, count)
+        if self._pending_total >= self.flush_threshold and not (self._flush_task and not self._flush_task.done()):
+            self._flush_task = create_background_task(self.flush(), name="counters flush")
+
+    def _add(self, document_id: str, field: str, count: int) -> None:
+        self._pending[document_id][field] += count
+        self._pending_total += abs(count)
+
+    def pending(self, field: str, document_id: str = "bot_config") -> int:
+        """Return the increments not yet written for a counter."""
+        return self._pending.get(document_id, {}).get(field, 0)
+
+    def pending_documents(self) -> dict:
+        """Return a snapshot of every pending increment, keyed by document _id."""
+        return {document_id: dict(fields) for document_id, fields in self._pending.items()}
+
+    async def flush(self) -> None:
+        """
+        Write every pending increment. Failed writes are put back for the next flush, and so is whatever
+        a cancelled flush hadn't written yet; a write cancelled in flight may then be applied twice, which
+        is preferred over losing it.
+        """
+        async with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            self._pending_total = 0
+            unwritten = dict(pending)
+            try:
+                for document_id, fields in pending.items():
+                    try:
+                        await self.collection.update_one({"_id": document_id}, {"$inc": dict(fields)}, upsert=True)
+                    except pymongo.errors.PyMongoError as e:
+                        logger.error("Failed to flush counters for %s: %s", document_id, e)
+                        continue
+                    del unwritten[document_id]
+            finally:
+                for document_id, fields in unwritten.items():
+                    for field, count in fields.items():
+                        self._add(document_id, field, count)
+
+    async def run(self) -> None:
+        """Flush periodically until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self) -> None:
+        """Let a threshold flush in progress finish, then flush whatever is left, e.g. on shutdown."""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+
+bot_counters = CounterAggregator(
+    bot_collection,
+    flush_interval=config('COUNTER_FLUSH_INTERVAL', default=5.0, cast=float),
+    flush_threshold=config('COUNTER_FLUSH_THRESHOLD', default=100, cast=int),
+)
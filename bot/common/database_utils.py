@@ -3,9 +3,63 @@ from datetime import datetime
 from decouple import config
 import pymongo
 
+from bot.common.admins import admin_roster
+from bot.common.bans import ban_registry
+from bot.common.cache import TTLCache
+from bot.common.counters import bot_counters
+from bot.common.resolver import anon_id_resolver
+from bot.common.stats import stats_rollup
 from bot.common.utils import create_unique_id
 from bot.database.database import users_collection, bot_collection
 
+# Named projections for hot paths; they leave out the unbounded arrays (referrals and the legacy ones)
+# unless a view really needs them, so reads stay small as user history grows. The conversation state lives
+# in the state store (see bot.common.conversation), not on the user document.
+IDENTITY_VIEW = {"_id": 0, "user_id": 1, "id": 1, "nickname": 1}
+FLAGS_VIEW = {"_id": 0, "user_id": 1, "id": 1, "is_banned": 1, "is_bot_off": 1, "first_time": 1}
+PROFILE_VIEW = {"_id": 0, "user_id": 1, "id": 1, "nickname": 1, "username": 1, "first_name": 1, "last_name": 1,
+                "joined_at": 1, "is_bot_off": 1, "referred": 1}
+
+
+def combine_views(*views: dict) -> dict:
+    """Merge several projections into one."""
+    projection = {}
+    for view in views:
+        projection.update(view)
+    return projection
+
+
+# Profile fields are read on almost every update but rarely change, so they are served from an in-process
+# cache. Any write to them must go through update_user_fields or call invalidate_user.
+CACHED_VIEW = combine_views(IDENTITY_VIEW, FLAGS_VIEW, PROFILE_VIEW)
+user_cache = TTLCache(maxsize=config('USER_CACHE_SIZE', default=10000, cast=int),
+                      ttl=config('USER_CACHE_TTL', default=300, cast=float))
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a user's cached record after a write."""
+    user_cache.invalidate(user_id)
+
+
+def _is_cacheable(projection: dict | None) -> bool:
+    return projection is not None and all(field in CACHED_VIEW for field, include in projection.items()
+                                          if include and field != "_id")
+
+
+async def _fetch_cached_user(user_id: int, projection: dict) -> dict | None:
+    """Serve a cacheable projection from the user cache, loading the cached view on a miss."""
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        generation = user_cache.generation(user_id)
+        user_data = await users_collection.find_one({"user_id": user_id}, CACHED_VIEW)
+        if user_data is None:
+            return None
+        # Not cached if a write invalidated the user while it was being read
+        user_cache.set(user_id, user_data, generation)
+    # Always hand out a copy so callers can't modify the cached record
+    return {field: user_data[field] for field, include in projection.items()
+            if include and field != "_id" and field in user_data}
+
 
 async def user_exists(user_id: int) -> bool:
     """
@@ -13,10 +67,11 @@ async def user_exists(user_id: int) -> bool:
     :param user_id: User ID to check.
     :return: True if user exists, False otherwise.
     """
-    return bool(users_collection.find_one({'user_id': user_id}))
+    return bool(await users_collection.find_one({'user_id': user_id}))
 
 
-async def save_user_data(user_id: int, nickname: str = None, username=None, first_name=None, last_name=None) -> None:
+async def save_user_data(user_id: int, nickname: str = None, username=None, first_name=None, last_name=None,
+                         first_time: bool = True) -> None:
     """
     Store user data in the database.
     :param first_name:
@@ -24,6 +79,7 @@ async def save_user_data(user_id: int, nickname: str = None, username=None, firs
     :param username:
     :param user_id: User ID.
     :param nickname: Nickname of the user.
+    :param first_time: Whether the first time greeting is still to be shown.
     """
     try:
         user_data = {
@@ -33,13 +89,10 @@ async def save_user_data(user_id: int, nickname: str = None, username=None, firs
             "username": username,
             "first_name": first_name,
             "last_name": last_name,
-            "awaiting_nickname": False,
             "joined_at": datetime.timestamp(datetime.now()),
-            "chats": [],
-            "blocklist": [],
             "is_bot_off": False,
             "version": config('VERSION', cast=float),
-            "first_time": True,
+            "first_time": first_time,
             "referred": False,
             "referred_by": '',
             "referrals": [],
@@ -47,41 +100,53 @@ async def save_user_data(user_id: int, nickname: str = None, username=None, firs
             "banned_by": None,
             "banned_at": None,
         }
-        users_collection.insert_one(user_data)
+        await users_collection.insert_one(user_data)
+        invalidate_user(user_id)
+        anon_id_resolver.add(user_id, user_data['id'])
+        await stats_rollup.record("users")
     except pymongo.errors.PyMongoError as e:
         print(f"Failed to store user data: {e}")
 
 
-def fetch_user_data_by_id(user_id: int) -> dict | None:
+async def fetch_user_data_by_id(user_id: int, projection: dict = None) -> dict | None:
     """
     Retrieve user data from the database.
     :param user_id: User ID.
+    :param projection: Fields to return (e.g. IDENTITY_VIEW), or None for the whole document.
     :return: User data dictionary or None if not found.
     """
-    return users_collection.find_one({"user_id": user_id}) or None
+    if _is_cacheable(projection):
+        return await _fetch_cached_user(user_id, projection)
+    return await users_collection.find_one({"user_id": user_id}, projection) or None
 
 
-def get_user_id(user_anon_id: str):
+async def get_user_id(user_anon_id: str):
     """
     Retrieve user id from database
     :param user_anon_id: the user anonymous id
     :return: the user id
     """
-    return users_collection.find_one({"id": user_anon_id}).get('user_id', None)
+    return await anon_id_resolver.get_user_id(user_anon_id)
 
 
-def get_user_anon_id(user_id: int):
+async def get_user_anon_id(user_id: int):
     """
     Retrieve user anonymous id from database
     :param user_id:
     :return:
     """
-    return users_collection.find_one({"user_id": user_id}).get('id', None)
+    return await anon_id_resolver.get_anon_id(user_id)
 
 
-def fetch_user_data_by_query(query: dict) -> dict | None:
-    """Retrieve a user by query."""
-    return users_collection.find_one(query)
+async def fetch_user_data_by_query(query: dict, projection: dict = None) -> dict | None:
+    """Retrieve a user by query, optionally limited to the fields in projection."""
+    if list(query) == ["id"] and isinstance(query["id"], str):
+        # Resolve the anonymous id in memory so the lookup can use the user cache
+        user_id = await anon_id_resolver.get_user_id(query["id"])
+        return await fetch_user_data_by_id(user_id, projection) if user_id is not None else None
+    if list(query) == ["user_id"]:
+        return await fetch_user_data_by_id(query["user_id"], projection)
+    return await users_collection.find_one(query, projection)
 
 
 async def update_user_fields(user_id: int, fields: dict | str, value: any = None, push: bool = False) -> bool:
@@ -102,13 +167,14 @@ async def update_user_fields(user_id: int, fields: dict | str, value: any = None
             # Update a single field
             update_operation = {"$push": {fields: value}} if push else {"$set": {fields: value}}
 
-        result = users_collection.update_one({"user_id": user_id}, update_operation, upsert=True)
+        result = await users_collection.update_one({"user_id": user_id}, update_operation, upsert=True)
+        invalidate_user(user_id)
         return result.modified_count > 0
     except pymongo.errors.PyMongoError as e:
         print(f"Failed to update user fields: {e}")
         return False
 
-def update_bot_fields(fields: dict | str, value: any = None) -> bool:
+async def update_bot_fields(fields: dict | str, value: any = None) -> bool:
     """
     Update bot fields, either one field or multiple fields.
 
@@ -124,52 +190,64 @@ def update_bot_fields(fields: dict | str, value: any = None) -> bool:
             # Update a single field
             update_operation = {"$set": {fields: value}}
 
-        result = bot_collection.update_one({"_id": "bot_config"}, update_operation, upsert=True)
+        result = await bot_collection.update_one({"_id": "bot_config"}, update_operation, upsert=True)
+        if 'admin' in update_operation["$set"]:
+            admin_roster.invalidate()
         return result.modified_count > 0
     except pymongo.errors.PyMongoError as e:
         print(f"Failed to update bot fields: {e}")
         return False
 
-async def update_ban_list(user_id: int, action: str) -> bool:
+async def update_ban_list(user_id: int, action: str, banned_by: int = None) -> bool:
     """
-    Update the ban list in the database.
+    Ban or unban a user with one conditional write to their own ban record.
 
     :param user_id: User ID to be banned or unbanned.
     :param action: Action to perform ('ban' or 'unban').
-    :return: True if updated successfully, False otherwise.
-    """
+    :param banned_by: User ID of the admin banning the user.
+    :return: True if the user's ban state changed, False if it already was as requested or the update failed.
+    """
+    if action == 'ban':
+        query = {"user_id": user_id, "is_banned": {"$ne": True}}
+        update = {"is_banned": True, "banned_by": banned_by, "banned_at": datetime.timestamp(datetime.now())}
+    elif action == 'unban':
+        query = {"user_id": user_id, "is_banned": True}
+        update = {"is_banned": False, "banned_by": None, "banned_at": None}
+    else:
+        raise ValueError(f"Unknown ban action: {action}")
     try:
-        if action == 'ban':
-            bot_collection.update_one({"_id": "ban_list"}, {"$addToSet": {"banned_users": user_id}}, upsert=True)
-        elif action == 'unban':
-            bot_collection.update_one({"_id": "ban_list"}, {"$pull": {"banned_users": user_id}}, upsert=True)
-        return True
+        # The is_banned condition makes a concurrent second ban (or unban) match nothing
+        result = await users_collection.update_one(query, {"$set": update})
     except pymongo.errors.PyMongoError as e:
         print(f"Failed to update ban list: {e}")
         return False
-def is_user_banned(user_id: int) -> bool:
+    if result.modified_count == 0:
+        return False
+    invalidate_user(user_id)
+    if action == 'ban':
+        ban_registry.add(user_id)
+    else:
+        ban_registry.remove(user_id)
+    return True
+
+async def is_user_banned(user_id: int) -> bool:
     """
-    Check if a user is banned.
+    Check if a user is banned, from the in-memory ban registry.
     :param user_id: User ID to check.
     :return: True if user is banned, False otherwise.
     """
-    if users_collection.find_one({"user_id": user_id}).get('is_banned'):
-        return True
-    return False
+    return ban_registry.is_banned(user_id)
 
-def is_admin(user_id: int) -> bool:
-    """Check if a user is an admin."""
-    if bot_collection.find_one({"admin": user_id}) is None:
-        return False
-    return True
+async def is_admin(user_id: int) -> bool:
+    """Check if a user is an admin, from the cached admin roster."""
+    return await admin_roster.is_admin(user_id)
 
 
 async def get_admins() -> list:
-    """Get the list of admin user IDs from the database."""
-    return bot_collection.find_one({"_id": "bot_config"}).get('admin', 0)
+    """Get the list of admin user IDs from the cached admin roster."""
+    return await admin_roster.members()
 
 
 async def update_total_messages(count: int):
-    """Update the total messages count in the database."""
-    bot_collection.update_one({"_id": "bot_config"}, {
-        "$inc": {"total_messages": count}}, upsert=True)
+    """Add to the total messages count; the write is batched by the counter aggregator."""
+    bot_counters.increment("total_messages", count)
@@ -0,0 +1,95 @@
+"""
+Time-bucketed counters for analytics.
+Every increment lands in a half-hourly and a daily bucket document whose _id encodes the metric,
+the granularity and the bucket start (e.g. "messages:hh:001760770800"), so a window is answered by
+an _id range scan over a few hundred small documents whatever the history size.
+Daily buckets follow Tehran days, and Tehran midnight always falls on a half hour, so a window starting
+at any Tehran day boundary (as the admin stats do) is counted exactly.
+"""
+import math
+import time
+from datetime import datetime, timedelta
+
+from decouple import config
+
+from bot.common.counters import CounterAggregator
+from bot.common.stats import TEHRAN
+from bot.database.database import metrics_collection
+
+HALF_HOUR = 30 * 60
+
+metric_counters = CounterAggregator(
+    metrics_collection,
+    flush_interval=config('COUNTER_FLUSH_INTERVAL', default=5.0, cast=float),
+    flush_threshold=config('COUNTER_FLUSH_THRESHOLD', default=100, cast=int),
+)
+
+
+def _bucket_id(metric: str, granularity: str, bucket_start: int) -> str:
+    # Zero padded so lexical _id order matches time order
+    return f"{metric}:{granularity}:{bucket_start:012d}"
+
+
+def _day_start(timestamp: float) -> int:
+    """Start of the Tehran day holding timestamp."""
+    day = datetime.fromtimestamp(timestamp, TEHRAN)
+    return int(day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def _next_day_start(timestamp: float) -> int:
+    """Start of the first Tehran day at or after timestamp."""
+    day_start = _day_start(timestamp)
+    if day_start == timestamp:
+        return day_start
+    next_day = datetime.fromtimestamp(day_start, TEHRAN) + timedelta(days=1)
+    return int(next_day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def record_metric(metric: str, count: int = 1, timestamp: float = None) -> None:
+    """
+    Add to a metric in its half-hourly and daily buckets; written behind by the counter aggregator.
+    :param metric: Metric name, e.g. "messages" or "chats".
+    :param count: Amount to add.
+    :param timestamp: When it happened, defaults to now.
+    """
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    metric_counters.increment("count", count, _bucket_id(metric, "hh", timestamp - timestamp % HALF_HOUR))
+    metric_counters.increment("count", count, _bucket_id(metric, "td", _day_start(timestamp)))
+
+
+def _bucket_ranges(metric: str, start: float, end: float) -> list:
+    """
+    Split [start, end) into half-hour edges and whole Tehran days, as (_id lower, _id upper) ranges.
+    The last half hour is counted whole, so a window ending now includes the current bucket.
+    """
+    if start % HALF_HOUR:
+        raise ValueError(f"Metric windows must start on a half hour, got {start}")
+    start = int(start)
+    end_slot = int(math.ceil(end / HALF_HOUR)) * HALF_HOUR
+    first_day = _next_day_start(start)
+    last_day = _day_start(end_slot)
+    if first_day >= last_day:
+        return [(_bucket_id(metric, "hh", start), _bucket_id(metric, "hh", end_slot))]
+    return [
+        (_bucket_id(metric, "hh", start), _bucket_id(metric, "hh", first_day)),
+        (_bucket_id(metric, "td", first_day), _bucket_id(metric, "td", last_day)),
+        (_bucket_id(metric, "hh", last_day), _bucket_id(metric, "hh", end_slot)),
+    ]
+
+
+async def count_metric(metric: str, start: float, end: float = None) -> int:
+    """
+    Sum a metric over a time window, with half-hour precision.
+    :param metric: Metric name.
+    :param start: Window start as a UNIX timestamp, on a half hour (ValueError otherwise).
+    :param end: Window end as a UNIX timestamp, defaults to now.
+    :return: Total count in the window, including increments not flushed yet.
+    """
+    end = end if end is not None else time.time()
+    ranges = _bucket_ranges(metric, start, end)
+    query = {"$or": [{"_id": {"$gte": lower, "$lt": upper}} for lower, upper in ranges]}
+    total = sum([bucket.get('count', 0) async for bucket in metrics_collection.find(query, {"count": 1})])
+    for document_id, fields in metric_counters.pending_documents().items():
+        if any(lower <= document_id < upper for lower, upper in ranges):
+            total += fields.get('count', 0)
+    return total
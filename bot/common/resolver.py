@@ -0,0 +1,73 @@
+import logging
+
+from bot.database.database import users_collection
+
+logger = logging.getLogger(__name__)
+
+
+class AnonIdResolver:
+    """
+    In-memory bidirectional index between Telegram user ids and anonymous ids.
+    The mapping never changes once a user is saved, so known ids are answered without a query;
+    unknown ids are looked up once and remembered.
+    """
+
+    def __init__(self):
+        self._anon_by_user = {}
+        self._user_by_anon = {}
+
+    def add(self, user_id: int, anon_id: str) -> None:
+        """Remember a user_id <-> anon_id pair."""
+        self._anon_by_user[user_id] = anon_id
+        self._user_by_anon[anon_id] = user_id
+
+    async def warm(self, batch_size: int = 5000) -> int:
+        """
+        Load every known pair from the users collection.
+        :return: Number of pairs loaded.
+        """
+        cursor = users_collection.find({}, {"_id": 0, "user_id": 1, "id": 1}).batch_size(batch_size)
+        async for user_data in cursor:
+            self._add_document(user_data)
+        logger.info("Anonymous id resolver warmed with %s users", len(self._anon_by_user))
+        return len(self._anon_by_user)
+
+    async def get_anon_id(self, user_id: int) -> str | None:
+        """Resolve a user id to its anonymous id."""
+        return (await self.get_anon_ids([user_id])).get(user_id)
+
+    async def get_user_id(self, anon_id: str) -> int | None:
+        """Resolve an anonymous id to its user id."""
+        return (await self.get_user_ids([anon_id])).get(anon_id)
+
+    async def get_anon_ids(self, user_ids: list) -> dict:
+        """
+        Resolve several user ids at once; the unknown ones cost a single $in query.
+        :return: {user_id: anon_id} for every id that exists.
+        """
+        missing = [user_id for user_id in user_ids if user_id not in self._anon_by_user]
+        if missing:
+            await self._load({"user_id": {"$in": missing}})
+        return {user_id: self._anon_by_user[user_id] for user_id in user_ids if user_id in self._anon_by_user}
+
+    async def get_user_ids(self, anon_ids: list) -> dict:
+        """
+        Resolve several anonymous ids at once; the unknown ones cost a single $in query.
+        :return: {anon_id: user_id} for every id that exists.
+        """
+        missing = [anon_id for anon_id in anon_ids if anon_id not in self._user_by_anon]
+        if missing:
+            await self._load({"id": {"$in": missing}})
+        return {anon_id: self._user_by_anon[anon_id] for anon_id in anon_ids if anon_id in self._user_by_anon}
+
+    async def _load(self, query: dict) -> None:
+        async for user_data in users_collection.find(query, {"_id": 0, "user_id": 1, "id": 1}):
+            self._add_document(user_data)
+
+    def _add_document(self, user_data: dict) -> None:
+        # Documents upserted by update_user_fields before the user was saved may lack either id
+        if user_data.get('id') is not None and user_data.get('user_id') is not None:
+            self.add(user_data['user_id'], user_data['id'])
+
+
+anon_id_resolver = AnonIdResolver()
@@ -0,0 +1,117 @@
+import logging
+
+from bot.common.conversation import conversation_states, ConversationState
+from bot.common.database_utils import update_user_fields
+from bot.database.database import users_collection, chats_collection, bot_collection
+from bot.database.migrations import run_batched_migration
+
+logger = logging.getLogger(__name__)
+
+# Conversation state transitions over the in-memory state store. A transition that doesn't apply
+# (e.g. leaving reply mode when not replying) changes nothing and returns None, so a double-tapped
+# button can't apply it twice or undo a newer state.
+REPLY_RESET = {"replying": False, "reply_target_message_id": "", "reply_target_user_id": ""}
+EDITING_RESET = {"editing_prompt_message_id": 0, "editing_target_message_id": 0, "editing_target_anon_id": ""}
+LEGACY_STATE_FIELDS = ["replying", "reply_target_message_id", "reply_target_user_id", "awaiting_nickname",
+                       "editing_prompt_message_id", "editing_target_message_id", "editing_target_anon_id"]
+
+
+def get_state(user_id: int) -> ConversationState:
+    """Return the user's conversation state."""
+    return conversation_states.get(user_id)
+
+
+async def enter_reply_mode(user_id: int, message_id: str, sender_anon_id: str) -> ConversationState:
+    """
+    Start replying to a message, leaving the nickname prompt if the user was in it.
+    :param user_id: User ID of the replier.
+    :param message_id: ID of the message being replied to.
+    :param sender_anon_id: Anonymous ID of the message's sender.
+    :return: The user's state after the transition.
+    """
+    return conversation_states.update(user_id, replying=True, reply_target_message_id=message_id,
+                                      reply_target_user_id=str(sender_anon_id), awaiting_nickname=False)
+
+
+async def leave_reply_mode(user_id: int) -> ConversationState | None:
+    """
+    Stop replying.
+    :return: The user's state after the transition, or None if the user wasn't replying.
+    """
+    if not conversation_states.get(user_id).replying:
+        return None
+    return conversation_states.update(user_id, **REPLY_RESET)
+
+
+async def begin_nickname_await(user_id: int) -> ConversationState:
+    """
+    Wait for the user's next message as their new nickname, leaving reply mode.
+    :return: The user's state after the transition.
+    """
+    return conversation_states.update(user_id, awaiting_nickname=True, **REPLY_RESET)
+
+
+async def end_nickname_await(user_id: int, nickname: str = None) -> ConversationState | None:
+    """
+    Stop waiting for a nickname, saving it when given.
+    :param user_id: User ID.
+    :param nickname: The new nickname, or None to cancel.
+    :return: The user's state after the transition, or None if no nickname was awaited.
+    """
+    if not conversation_states.get(user_id).awaiting_nickname:
+        return None
+    state = conversation_states.update(user_id, awaiting_nickname=False)
+    if nickname is not None:
+        await update_user_fields(user_id, "nickname", nickname)
+    return state
+
+
+async def finish_editing(user_id: int) -> ConversationState:
+    """Clear the message editing state."""
+    return conversation_states.update(user_id, **EDITING_RESET)
+
+
+async def import_legacy_states() -> int:
+    """
+    One-time import of the conversation state still stored on user and chat documents, from before
+    the state store existed. Run before the bot starts handling updates so it can't overwrite newer state.
+    :return: Number of users whose state was imported.
+    """
+    if await bot_collection.find_one({"_id": "conversation_states", "imported": True}):
+        return 0
+    imported = set()
+    query = {"$or": [{"replying": True}, {"awaiting_nickname": True},
+                     {"editing_prompt_message_id": {"$nin": [0, None, ""]}}]}
+    async for user_data in users_collection.find(query, {"_id": 0, "user_id": 1, **{f: 1 for f in LEGACY_STATE_FIELDS}}):
+        fields = {field: user_data[field] for field in LEGACY_STATE_FIELDS if user_data.get(field) is not None}
+        conversation_states.update(user_data['user_id'], **fields)
+        imported.add(user_data['user_id'])
+    async for chat in chats_collection.find({"open": True}, {"_id": 0, "owner_id": 1, "target_user_id": 1,
+                                                             "target_user_anon_id": 1}):
+        conversation_states.update(chat['owner_id'], open_chat_target_id=chat['target_user_id'],
+                                   open_chat_target_anon_id=chat.get('target_user_anon_id'))
+        imported.add(chat['owner_id'])
+    await conversation_states.snapshot()
+    await bot_collection.update_one({"_id": "conversation_states"}, {"$set": {"imported": True}}, upsert=True)
+    logger.info("Imported the conversation state of %s users", len(imported))
+    return len(imported)
+
+
+async def drop_legacy_state_fields(batch_size: int = 500, pause: float = 0.1) -> int:
+    """
+    Background removal of the imported state fields from user and chat documents.
+    :return: Number of documents cleaned.
+    """
+    cleaned = 0
+    for name, collection, query, unset in [
+        ("user_state_fields", users_collection,
+         {"$or": [{field: {"$exists": True}} for field in LEGACY_STATE_FIELDS]},
+         {field: "" for field in LEGACY_STATE_FIELDS}),
+        ("chat_open_field", chats_collection, {"open": {"$exists": True}}, {"open": ""}),
+    ]:
+        async def clean_batch(batch: list, collection=collection, unset=unset) -> None:
+            await collection.update_many({"_id": {"$in": [document['_id'] for document in batch]}},
+                                         {"$unset": unset})
+
+        cleaned += await run_batched_migration(name, collection, query, {}, clean_batch, batch_size, pause)
+    return cleaned
@@ -0,0 +1,205 @@
+"""
+Incrementally maintained stats rollup.
+New users and chats are counted into one small document per period (today, this week, this month,
+this year and all time), so the admin panel renders stats from a single read. Periods roll over at
+Tehran midnight, week, month and year boundaries, and a scheduled reconcile replaces the counters
+with a full recount to correct any drift.
+
+Stats that still take a computation are served through a StatsService, which caches them and
+refreshes them in the background, so readers never wait for one.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pymongo
+
+from bot.database.database import bot_collection
+
+logger = logging.getLogger(__name__)
+
+TEHRAN = ZoneInfo("Asia/Tehran")
+ROLLUP_ID = "stats_rollup"
+KINDS = ("users", "chats")
+PERIODS = ("today", "this_week", "this_month", "this_year")
+
+
+def period_starts(now: datetime = None) -> dict:
+    """Start of today, this week (Monday), this month and this year in Tehran, as UNIX timestamps."""
+    now = now or datetime.now(TEHRAN)
+    start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'today': start_of_today.timestamp(),
+        'this_week': (start_of_today - timedelta(days=start_of_today.weekday())).timestamp(),
+        'this_month': start_of_today.replace(day=1).timestamp(),
+        'this_year': start_of_today.replace(month=1, day=1).timestamp(),
+    }
+
+
+def period_keys(now: datetime = None) -> dict:
+    """Name of the current period for each rollup period, e.g. {"today": "2024-10-20", ...}."""
+    now = now or datetime.now(TEHRAN)
+    start_of_week = now - timedelta(days=now.weekday())
+    return {
+        'today': now.strftime("%Y-%m-%d"),
+        'this_week': start_of_week.strftime("%Y-%m-%d"),
+        'this_month': now.strftime("%Y-%m"),
+        'this_year': now.strftime("%Y"),
+    }
+
+
+class StatsRollup:
+    """Counters of new users and chats per period, kept in one document of the bot collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record(self, kind: str, count: int = 1) -> None:
+        """
+        Count new users or chats in every period, rolling over the periods that ended since the last write.
+        :param kind: "users" or "chats".
+        :param count: Amount to add.
+        """
+        keys = period_keys()
+        counters = {f"{kind}.all_time": {"$add": [{"$ifNull": [f"${kind}.all_time", 0]}, count]}}
+        for period in PERIODS:
+            for counter in KINDS:
+                added = count if counter == kind else 0
+                # A period that rolled over starts again from zero, for every kind
+                counters[f"{counter}.{period}"] = {"$cond": [
+                    {"$eq": [f"$periods.{period}", keys[period]]},
+                    {"$add": [{"$ifNull": [f"${counter}.{period}", 0]}, added]},
+                    added,
+                ]}
+        # writes lets a reconcile tell whether anything was recorded while it recounted
+        counters["writes"] = {"$add": [{"$ifNull": ["$writes", 0]}, 1]}
+        try:
+            await self.collection.update_one({"_id": ROLLUP_ID}, [
+                {"$set": counters},
+                {"$set": {f"periods.{period}": keys[period] for period in PERIODS}},
+            ], upsert=True)
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to record %s in the stats rollup: %s", kind, e)
+
+    async def read(self) -> dict:
+        """
+        Return the counters, e.g. {"users": {"today": 3, ..., "all_time": 120}, "chats": {...}}.
+        Periods that ended since the last write read as zero.
+        """
+        rollup = await self.collection.find_one({"_id": ROLLUP_ID}) or {}
+        keys = period_keys()
+        stored_keys = rollup.get('periods', {})
+        counts = {}
+        for kind in KINDS:
+            stored = rollup.get(kind, {})
+            counts[kind] = {period: stored.get(period, 0) if stored_keys.get(period) == keys[period] else 0
+                            for period in PERIODS}
+            counts[kind]['all_time'] = stored.get('all_time', 0)
+        counts['reconciled_at'] = rollup.get('reconciled_at')
+        return counts
+
+    async def reconcile(self, recount, attempts: int = 3) -> bool:
+        """
+        Replace the counters with a full recount.
+        The replace only applies if nothing was recorded since the recount started, as the recount may
+        have missed it; otherwise the recount is retried, and after attempts tries the counters are left
+        for the next reconcile.
+        :param recount: Coroutine function returning {"users": {...}, "chats": {...}} with the same periods.
+        :param attempts: Recounts to try before giving up.
+        :return: True if the counters were replaced.
+        """
+        for _ in range(attempts):
+            rollup = await self.collection.find_one({"_id": ROLLUP_ID}, {"writes": 1})
+            writes = rollup.get('writes', 0) if rollup else None
+            keys = period_keys()
+            counts = await recount()
+            replacement = {
+                "_id": ROLLUP_ID,
+                **{kind: {period: counts[kind][period] for period in (*PERIODS, 'all_time')} for kind in KINDS},
+                "periods": keys,
+                "writes": writes or 0,
+                "reconciled_at": time.time(),
+            }
+            try:
+                if rollup is None:
+                    await self.collection.insert_one(replacement)
+                    replaced = True
+                else:
+                    result = await self.collection.replace_one(
+                        {"_id": ROLLUP_ID, "writes": writes} if writes else
+                        {"_id": ROLLUP_ID, "writes": {"$in": [0, None]}}, replacement)
+                    replaced = result.matched_count > 0
+            except pymongo.errors.DuplicateKeyError:
+                replaced = False  # Created by a record() meanwhile
+            if replaced:
+                logger.info("Stats rollup reconciled: %s", {kind: counts[kind]['all_time'] for kind in KINDS})
+                return True
+        logger.warning("Stats rollup kept changing during %s recounts, leaving it for the next reconcile", attempts)
+        return False
+
+    async def run(self, recount, interval: float = 3600.0) -> None:
+        """Reconcile right away and then every interval seconds, until cancelled."""
+        while True:
+            try:
+                await self.reconcile(recount)
+            except pymongo.errors.PyMongoError as e:
+                logger.error("Failed to reconcile the stats rollup: %s", e)
+            await asyncio.sleep(interval)
+
+
+class StatsService:
+    """
+    Computed stats cached for ttl seconds and refreshed in the background before they go stale,
+    so readers always get an answer at once, along with the time it was computed.
+    Each stat is registered with the coroutine function computing it; concurrent refreshes of the
+    same stat share one computation.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._loaders = {}
+        self._entries = {}
+        self._refreshes = {}
+
+    def register(self, name: str, loader) -> None:
+        """Register the coroutine function computing a stat."""
+        self._loaders[name] = loader
+
+    async def get(self, name: str) -> tuple:
+        """
+        Return a stat, stale-while-revalidate: an expired value is returned right away while
+        a background refresh replaces it. Only the very first read waits for the computation.
+        :return: (value, computed_at as a UNIX timestamp)
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = await self._refresh(name)
+            if entry is None:
+                raise RuntimeError(f"Stats {name} are unavailable")
+        elif time.time() - entry[1] >= self.ttl:
+            self._refresh(name)
+        return entry
+
+    def _refresh(self, name: str) -> asyncio.Task:
+        task = self._refreshes.get(name)
+        if task is None or task.done():
+            task = self._refreshes[name] = asyncio.create_task(self._load(name))
+        return task
+
+    async def _load(self, name: str) -> tuple | None:
+        try:
+            self._entries[name] = (await self._loaders[name](), time.time())
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to compute the %s stats: %s", name, e)
+        return self._entries.get(name)
+
+    async def run(self) -> None:
+        """Refresh every registered stat twice per ttl so readers never see an expired one, until cancelled."""
+        while True:
+            await asyncio.gather(*(self._refresh(name) for name in self._loaders))
+            await asyncio.sleep(self.ttl / 2)
+
+
+stats_rollup = StatsRollup(bot_collection)
@@ -0,0 +1,16 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_name(), exc_info=task.exception())
+
+
+def create_background_task(coro, name: str = None) -> asyncio.Task:
+    """Start a task whose failure is logged when it happens, instead of going unnoticed."""
+    task = asyncio.create_task(coro, name=name)
+    task.add_done_callback(_log_failure)
+    return task
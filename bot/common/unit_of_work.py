@@ -0,0 +1,111 @@
+import logging
+from collections import defaultdict
+
+import pymongo
+from pymongo import UpdateOne
+
+from bot.common.database_utils import invalidate_user
+from bot.database.database import users_collection
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """
+    User document writes collected while handling one update and committed together when it finishes.
+    Every $set/$push/$addToSet aimed at the same user becomes a single update_one, and writes to
+    several users a single unordered bulk_write.
+
+    Use it as `async with UnitOfWork() as uow:`, or call commit() yourself; writes made before an error
+    are still committed, the same as when each of them went straight to the database.
+    """
+
+    def __init__(self, collection=users_collection):
+        self.collection = collection
+        self._updates = defaultdict(lambda: defaultdict(dict))
+
+    def set(self, user_id: int, fields: dict | str, value: any = None) -> None:
+        """
+        Queue a $set, either one field or multiple fields.
+        :param user_id: User ID.
+        :param fields: A single field (str) to set, or a dictionary of fields to set.
+        :param value: New value for the field (only needed if setting a single field).
+        """
+        fields = fields if isinstance(fields, dict) else {fields: value}
+        update = self._updates[user_id]
+        for field in fields:
+            # A later $set replaces whatever was queued for the field before
+            update["$push"].pop(field, None)
+            update["$addToSet"].pop(field, None)
+        update["$set"].update(fields)
+
+    def push(self, user_id: int, field: str, value: any) -> None:
+        """Queue appending a value to a list field."""
+        self._queue_list_update(user_id, field, value, unique=False)
+
+    def add_to_set(self, user_id: int, field: str, value: any) -> None:
+        """
+        Queue adding a value to a list field, unless it's already there.
+        Mixed with push() on the same field, both become one $push, so the value is only checked
+        against the other queued values, not the stored list.
+        """
+        self._queue_list_update(user_id, field, value, unique=True)
+
+    def _queue_list_update(self, user_id: int, field: str, value: any, unique: bool) -> None:
+        # Each field is only ever queued under one operator, since the server rejects an update
+        # touching the same path twice. Only a $set replaces queued appends; appends never drop anything.
+        update = self._updates[user_id]
+        if field in update["$set"]:
+            queued = update["$set"][field]
+            if not isinstance(queued, list):
+                raise ValueError(f"Can't append to {field}, it's queued to be set to a non-list value")
+            # The field is being replaced anyway, so apply the append to the new value
+            if not unique or value not in queued:
+                update["$set"][field] = queued + [value]
+            return
+        if unique and field not in update["$push"]:
+            values = update["$addToSet"].setdefault(field, {"$each": []})["$each"]
+        else:
+            # A push joins any queued add-to-set values into one $push, keeping their order
+            queued = update["$addToSet"].pop(field, {"$each": []})
+            values = update["$push"].setdefault(field, queued)["$each"]
+        if not unique or value not in values:
+            values.append(value)
+
+    def pending(self, user_id: int) -> dict:
+        """Return the $set fields queued for a user, e.g. to read a value written earlier in the update."""
+        return dict(self._updates.get(user_id, {}).get("$set", {}))
+
+    def _operations(self) -> dict:
+        operations = {}
+        for user_id, update in self._updates.items():
+            operation = {operator: fields for operator, fields in update.items() if fields}
+            if operation:
+                operations[user_id] = operation
+        return operations
+
+    async def commit(self) -> None:
+        """Write every queued change and forget it."""
+        operations, self._updates = self._operations(), defaultdict(lambda: defaultdict(dict))
+        if not operations:
+            return
+        try:
+            if len(operations) == 1:
+                [(user_id, operation)] = operations.items()
+                await self.collection.update_one({"user_id": user_id}, operation)
+            else:
+                await self.collection.bulk_write(
+                    [UpdateOne({"user_id": user_id}, operation) for user_id, operation in operations.items()],
+                    ordered=False
+                )
+        except pymongo.errors.PyMongoError as e:
+            logger.error("Failed to commit user updates: %s", e)
+        finally:
+            for user_id in operations:
+                invalidate_user(user_id)
+
+    async def __aenter__(self) -> 'UnitOfWork':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.commit()
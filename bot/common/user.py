@@ -1,10 +1,11 @@
 from telebot.async_telebot import AsyncTeleBot
 
-from bot.database.database import users_collection
+from bot.common.database_utils import fetch_user_data_by_id
 
 
-def is_bot_status_off(user_id: str | int):
-    if users_collection.find_one({"user_id": user_id}).get('is_bot_off', False):
+async def is_bot_status_off(user_id: str | int):
+    user_data = await fetch_user_data_by_id(user_id, {"_id": 0, "is_bot_off": 1})
+    if user_data and user_data.get('is_bot_off', False):
         return True
     return False
 
@@ -89,6 +89,7 @@ class MessageValidator:
 
     # Define special characters for Markdown formatting
     MARKDOWN_SPECIAL_CHARS = r'_*[]()~`>#+-=|{}.!'
+    LEGACY_MARKDOWN_SPECIAL_CHARS = r'_*`['
 
     @classmethod
     def escape_markdown(cls, text: str) -> str:
@@ -99,6 +100,16 @@ class MessageValidator:
         """
         return re.sub(f'([{re.escape(cls.MARKDOWN_SPECIAL_CHARS)}])', r'\\\1', text)
 
+    @classmethod
+    def escape_legacy_markdown(cls, text: str) -> str:
+        """
+        Escapes text for the legacy 'Markdown' parse mode, which only allows escaping _ * ` and [
+        outside of an entity, so the escaped text must not be placed inside one.
+        :param text: The input text to escape.
+        :return: Escaped text safe for legacy Markdown.
+        """
+        return re.sub(f'([{re.escape(cls.LEGACY_MARKDOWN_SPECIAL_CHARS)}])', r'\\\1', text)
+
     @classmethod
     def validate_and_format(cls, text: str, parse_mode: str = 'Markdown') -> str:
         """
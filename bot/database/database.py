@@ -1,31 +1,235 @@
 from decouple import config
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
 import logging
 
+from bot.database.monitoring import PoolMonitor, CommandMonitor
+
 logger = logging.getLogger(__name__)
 
-# Connect to MongoDB
-client = MongoClient(config('MONGO_URI', cast=str))
-db = client.get_database(config('DATABASE_NAME', cast=str))
-users_collection = db.get_collection(config('USERS_COLLECTION', cast=str))
-bot_collection = db.get_collection(config('BOT_COLLECTION', cast=str))
+# Pool and command listeners, reporting checkout waits, in-use connections and per-command latency
+pool_monitor = PoolMonitor(slow_checkout_ms=config('MONGO_SLOW_CHECKOUT_MS', default=50, cast=float))
+command_monitor = CommandMonitor(slow_command_ms=config('MONGO_SLOW_COMMAND_MS', default=100, cast=float))
+
+
+def client_options() -> dict:
+    """Connection pool, compression and read preference options for the client, from the config."""
+    options = {
+        "maxPoolSize": config('MONGO_MAX_POOL_SIZE', default=100, cast=int),
+        "minPoolSize": config('MONGO_MIN_POOL_SIZE', default=0, cast=int),
+        "readPreference": config('MONGO_READ_PREFERENCE', default='primary', cast=str),
+        "event_listeners": [pool_monitor, command_monitor],
+    }
+    # 0 keeps pymongo's default of waiting for a free connection without a limit
+    wait_queue_timeout_ms = config('MONGO_WAIT_QUEUE_TIMEOUT_MS', default=0, cast=int)
+    if wait_queue_timeout_ms > 0:
+        options["waitQueueTimeoutMS"] = wait_queue_timeout_ms
+    # e.g. "zstd,zlib"; zstd and snappy need their optional packages installed
+    compressors = config('MONGO_COMPRESSORS', default='', cast=str)
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+class CollectionHandle:
+    """
+    Module-level handle for a collection, bound by init_database().
+    Modules import the handles freely; nothing connects until the bot starts, and any object with the
+    collection API (e.g. a local stand-in for tests or benchmarks) can be bound in place of a real collection.
+    """
+
+    def __init__(self, setting: str, default: str = None):
+        self.setting = setting
+        self.default = default
+        self._collection = None
+
+    def collection_name(self) -> str:
+        if self.default is None:
+            return config(self.setting, cast=str)
+        return config(self.setting, default=self.default, cast=str)
+
+    def bind(self, collection) -> None:
+        self._collection = collection
+
+    def unbind(self) -> None:
+        self._collection = None
+
+    @property
+    def is_bound(self) -> bool:
+        return self._collection is not None
+
+    def __getattr__(self, item):
+        collection = self.__dict__.get('_collection')
+        if collection is None:
+            raise RuntimeError(f"Collection {self.__dict__.get('setting')} is not bound; call init_database() first")
+        return getattr(collection, item)
+
+
+users_collection = CollectionHandle('USERS_COLLECTION')
+bot_collection = CollectionHandle('BOT_COLLECTION')
+chats_collection = CollectionHandle('CHATS_COLLECTION', default='chats')
+seen_collection = CollectionHandle('SEEN_COLLECTION', default='seen_messages')
+blocks_collection = CollectionHandle('BLOCKS_COLLECTION', default='blocks')
+metrics_collection = CollectionHandle('METRICS_COLLECTION', default='metrics')
+states_collection = CollectionHandle('STATES_COLLECTION', default='conversation_states')
+COLLECTIONS = [users_collection, bot_collection, chats_collection, seen_collection, blocks_collection,
+               metrics_collection, states_collection]
+
+_client = None
+
+
+async def init_database(client=None, **collections) -> None:
+    """
+    Create the client and bind every collection handle that isn't bound yet.
+    :param client: Client to use instead of one built from MONGO_URI, e.g. a local stand-in backend.
+    :param collections: Collections to bind as-is, keyed by handle name (e.g. users_collection=...).
+    """
+    global _client
+    for name, collection in collections.items():
+        handle = globals().get(name)
+        if handle not in COLLECTIONS:
+            raise ValueError(f"Unknown collection handle: {name}")
+        handle.bind(collection)
+    if all(handle.is_bound for handle in COLLECTIONS):
+        return
+    if _client is None:
+        # asyncio-native client, so queries never block the event loop; it connects on the first operation
+        _client = client or AsyncMongoClient(config('MONGO_URI', cast=str), **client_options())
+    db = _client.get_database(config('DATABASE_NAME', cast=str))
+    for handle in COLLECTIONS:
+        if not handle.is_bound:
+            handle.bind(db.get_collection(handle.collection_name()))
+
 
-def init_bot_config():
+# Seen receipts expire after this many days; 0 keeps them forever
+SEEN_TTL_DAYS = config('SEEN_TTL_DAYS', default=0, cast=int)
+
+# Indexes every hot lookup relies on, created and verified at startup
+USERS_INDEXES = [
+    IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    # Partial, so documents upserted without an anon id don't collide on a null key
+    IndexModel([("id", ASCENDING)], name="anon_id_unique", unique=True,
+               partialFilterExpression={"id": {"$exists": True}}),
+    IndexModel([("joined_at", ASCENDING)], name="joined_at"),
+    # Only banned users are indexed, so loading the ban registry and paging the ban list read a small index
+    IndexModel([("is_banned", ASCENDING), ("user_id", ASCENDING)], name="banned_users",
+               partialFilterExpression={"is_banned": True}),
+]
+CHATS_INDEXES = [
+    IndexModel([("owner_id", ASCENDING), ("target_user_id", ASCENDING)], name="owner_target_unique", unique=True),
+    IndexModel([("chat_created_at", ASCENDING)], name="chat_created_at"),
+]
+SEEN_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("message_id", ASCENDING)], name="user_message_unique", unique=True),
+]
+if SEEN_TTL_DAYS > 0:
+    SEEN_INDEXES.append(IndexModel([("seen_at", ASCENDING)], name="seen_at_ttl",
+                                   expireAfterSeconds=SEEN_TTL_DAYS * 24 * 60 * 60))
+BLOCKS_INDEXES = [
+    IndexModel([("blocker", ASCENDING), ("blocked", ASCENDING)], name="blocker_blocked_unique", unique=True),
+    IndexModel([("blocker", ASCENDING), ("blocked_at", ASCENDING)], name="blocker_blocked_at"),
+]
+# State snapshots keyed by user id; ones not updated for this long are dropped
+STATES_INDEXES = [
+    IndexModel([("updated_at", ASCENDING)], name="updated_at_ttl",
+               expireAfterSeconds=config('CONVERSATION_STATE_TTL', default=86400, cast=int)),
+]
+
+# Query shapes checked with explain() at startup; sample values only need the right type
+QUERY_SHAPES = [
+    ("users.by_user_id", users_collection, {"user_id": 0}),
+    ("users.by_anon_id", users_collection, {"id": ""}),
+    ("users.joined_since", users_collection, {"joined_at": {"$gte": 0}}),
+    ("users.banned_page", users_collection, {"is_banned": True, "user_id": {"$gt": 0}}),
+    ("chats.by_owner_target", chats_collection, {"owner_id": 0, "target_user_id": 0}),
+    ("chats.created_since", chats_collection, {"chat_created_at": {"$gte": 0}}),
+    ("seen.by_user_message", seen_collection, {"user_id": 0, "message_id": 0}),
+    ("blocks.by_blocker", blocks_collection, {"blocker": ""}),
+    ("blocks.mutual", blocks_collection, {"$or": [{"blocker": "", "blocked": ""}, {"blocker": "", "blocked": ""}]}),
+]
+
+
+async def init_bot_config():
     default_bot_config = {
         "_id": "bot_config",
         "admin": [],
         "total_messages": 0
     }
 
-    default_ban_list = {
-        "_id": "ban_list",
-        "banned_users": []
-    }
-
     # Check and insert if not exists
-    for doc in [default_bot_config, default_ban_list]:
-        if bot_collection.find_one({"_id": doc["_id"]}) is None:
-            bot_collection.insert_one(doc)
+    for doc in [default_bot_config]:
+        if await bot_collection.find_one({"_id": doc["_id"]}) is None:
+            await bot_collection.insert_one(doc)
             logger.info("Inserted default config for: %s", doc["_id"])
         else:
             logger.info("Config for %s already exists.", doc["_id"])
+
+    await ensure_indexes()
+    await report_query_plans()
+
+
+async def ensure_indexes():
+    """Create the required indexes and verify they exist with the expected options."""
+    for collection, indexes in [(users_collection, USERS_INDEXES), (chats_collection, CHATS_INDEXES), (seen_collection, SEEN_INDEXES),
+                                (blocks_collection, BLOCKS_INDEXES), (states_collection, STATES_INDEXES)]:
+        try:
+            existing = await collection.index_information()
+            for index in indexes:
+                spec = index.document
+                info = existing.get(spec["name"])
+                if info is not None and info.get("partialFilterExpression") != spec.get("partialFilterExpression"):
+                    # An index can't be altered in place; rebuild it with the new filter
+                    logger.info("Rebuilding index %s on %s", spec["name"], collection.name)
+                    await collection.drop_index(spec["name"])
+            await collection.create_indexes(indexes)
+        except PyMongoError as e:
+            logger.error("Failed to create indexes on %s: %s", collection.name, e)
+
+        existing = await collection.index_information()
+        for index in indexes:
+            spec = index.document
+            info = existing.get(spec["name"])
+            if info is None:
+                logger.error("Index %s is missing on %s", spec["name"], collection.name)
+            elif spec.get("unique") and not info.get("unique"):
+                logger.error("Index %s on %s is not unique", spec["name"], collection.name)
+            else:
+                logger.info("Index %s on %s is ready.", spec["name"], collection.name)
+
+
+async def report_query_plans():
+    """Explain every registered query shape and flag the ones still doing a collection scan."""
+    for name, collection, query in QUERY_SHAPES:
+        try:
+            plan = await collection.find(query).explain()
+        except PyMongoError as e:
+            logger.warning("Could not explain query %s: %s", name, e)
+            continue
+        stages = _plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            logger.warning("Query %s %s is doing a COLLSCAN", name, query)
+        else:
+            logger.info("Query %s uses %s", name, " <- ".join(stages))
+
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten a winning plan into the list of its stage names."""
+    if "queryPlan" in plan:  # Slot-based engine wraps the classic plan
+        plan = plan["queryPlan"]
+    stages = [plan["stage"]] if "stage" in plan else []
+    children = plan.get("inputStages", [])
+    if "inputStage" in plan:
+        children = [plan["inputStage"], *children]
+    for child in children:
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def close_database():
+    """Close the MongoDB client and its connection pool, and unbind the collection handles."""
+    global _client
+    for handle in COLLECTIONS:
+        handle.unbind()
+    if _client is not None:
+        await _client.close()
+        _client = None
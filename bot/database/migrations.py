@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from decouple import config
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
+
+from bot.database.database import users_collection, bot_collection
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_ID = "schema_migration"
+
+# Ordered schema steps for user documents. Each step only fills fields that are missing, so running it
+# again, or over documents that already have the fields, changes nothing.
+# Conversation state fields (replying, editing_*, ...) aren't backfilled: they live in the state store.
+MIGRATIONS = [
+    ("account_fields", {
+        "is_bot_off": False,
+        "first_time": False,
+        "referred": False,
+        "referred_by": "",
+        "referrals": [],
+        "is_banned": False,
+        "banned_by": None,
+        "banned_at": None,
+    }),
+]
+
+
+def _migration_pipeline(target_version: float) -> list:
+    """Build the update pipeline applying every step in order, then stamping the target version."""
+    pipeline = [
+        {"$set": {field: {"$ifNull": [f"${field}", {"$literal": default}]} for field, default in defaults.items()}}
+        for _, defaults in MIGRATIONS
+    ]
+    pipeline.append({"$set": {"version": {"$literal": target_version}}})
+    return pipeline
+
+
+async def _load_progress(target_version: float) -> dict:
+    """Return the recorded progress for target_version, starting over when it was recorded for another one."""
+    progress = await bot_collection.find_one({"_id": PROGRESS_ID})
+    if not progress or progress.get('target_version') != target_version:
+        progress = {"_id": PROGRESS_ID, "target_version": target_version, "last_id": None, "migrated": 0,
+                    "failed_ids": [], "completed_at": None}
+        await bot_collection.replace_one({"_id": PROGRESS_ID}, progress, upsert=True)
+    return progress
+
+
+async def run_migrations(target_version: float = None, batch_size: int = None, pause: float = None,
+                         max_retries: int = None) -> int:
+    """
+    Bring every user document to target_version in throttled batches.
+    Progress is recorded in the bot collection after every batch, so an interrupted run resumes where it
+    stopped; a finished run for the same version returns right away.
+    Documents the server rejects are recorded under failed_ids in the progress document and skipped.
+    A batch failing as a whole (e.g. the server is unreachable) is retried with a growing pause, and after
+    max_retries attempts the migration stops with an error, to resume from the same batch on the next start.
+    :param target_version: Schema version to reach, VERSION by default.
+    :param batch_size: Users updated per bulk_write.
+    :param pause: Seconds to sleep between batches, leaving room for live traffic.
+    :param max_retries: Attempts per batch before giving up.
+    :return: Number of users migrated by this run.
+    """
+    target_version = target_version if target_version is not None else config('VERSION', cast=float)
+    batch_size = batch_size or config('MIGRATION_BATCH_SIZE', default=500, cast=int)
+    pause = pause if pause is not None else config('MIGRATION_PAUSE', default=0.2, cast=float)
+    max_retries = max_retries or config('MIGRATION_MAX_RETRIES', default=5, cast=int)
+
+    progress = await _load_progress(target_version)
+    if progress.get('completed_at'):
+        return 0
+
+    pipeline = _migration_pipeline(target_version)
+    last_id = progress.get('last_id')
+    migrated = 0
+    failures = 0
+    while True:
+        query = {"version": {"$ne": target_version}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await users_collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size).to_list()
+        if not batch:
+            break
+        ids = [user_data['_id'] for user_data in batch]
+        failed_ids = []
+        try:
+            # The version filter keeps a retried batch from touching users migrated in the meantime
+            await users_collection.bulk_write(
+                [UpdateOne({"_id": _id, "version": {"$ne": target_version}}, pipeline) for _id in ids],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # The rest of an unordered batch was applied; only the rejected documents are skipped
+            failed_ids = [ids[error['index']] for error in e.details.get('writeErrors', [])]
+            logger.error("Schema migration skipped %s users the server rejected: %s", len(failed_ids),
+                         e.details.get('writeErrors', [])[:1])
+        except PyMongoError as e:
+            failures += 1
+            if failures >= max_retries:
+                logger.error("Schema migration stopped after %s failed attempts at the batch after %s: %s",
+                             failures, last_id, e)
+                raise
+            logger.warning("Schema migration batch after %s failed (attempt %s of %s): %s", last_id, failures,
+                           max_retries, e)
+            await asyncio.sleep(pause * 2 ** failures)
+            continue
+        failures = 0
+        last_id = ids[-1]
+        migrated += len(ids) - len(failed_ids)
+        update = {"$set": {"last_id": last_id}, "$inc": {"migrated": len(ids) - len(failed_ids)}}
+        if failed_ids:
+            update["$addToSet"] = {"failed_ids": {"$each": failed_ids}}
+        await bot_collection.update_one({"_id": PROGRESS_ID}, update)
+        await asyncio.sleep(pause)
+
+    await bot_collection.update_one({"_id": PROGRESS_ID},
+                                    {"$set": {"completed_at": datetime.timestamp(datetime.now())}})
+    logger.info("Schema migration to version %s finished, %s users migrated by this run", target_version, migrated)
+    return migrated
+
+
+async def run_batched_migration(name: str, collection, query: dict, projection: dict, apply,
+                                batch_size: int = 100, pause: float = 0.1) -> int:
+    """
+    One-off background migration over the documents matching query, walked in _id order in batches.
+    The last _id handled is recorded in the bot collection after every batch, so an interrupted run resumes
+    where it stopped instead of rescanning, and a finished one is marked done so later starts skip it.
+    :param name: Migration name; its progress is kept under the "migration:<name>" document.
+    :param collection: Collection to migrate.
+    :param query: Documents still needing the migration.
+    :param projection: Fields apply needs; _id is always included.
+    :param apply: Coroutine function applied to each batch (a list of documents).
+    :param batch_size: Documents per batch.
+    :param pause: Seconds to sleep between batches, leaving room for live traffic.
+    :return: Number of documents migrated by this run.
+    """
+    progress_id = f"migration:{name}"
+    progress = await bot_collection.find_one({"_id": progress_id}) or {}
+    if progress.get('done'):
+        return 0
+    last_id = progress.get('last_id')
+    migrated = 0
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = await collection.find(batch_query, {**projection, "_id": 1}).sort("_id", 1).limit(batch_size).to_list()
+        if not batch:
+            break
+        await apply(batch)
+        last_id = batch[-1]['_id']
+        migrated += len(batch)
+        await bot_collection.update_one({"_id": progress_id}, {"$set": {"last_id": last_id},
+                                                               "$inc": {"migrated": len(batch)}}, upsert=True)
+        await asyncio.sleep(pause)
+
+    await bot_collection.update_one({"_id": progress_id},
+                                    {"$set": {"done": True, "completed_at": datetime.timestamp(datetime.now())}},
+                                    upsert=True)
+    if migrated:
+        logger.info("Migration %s finished, %s documents migrated by this run", name, migrated)
+    return migrated
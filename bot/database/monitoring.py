@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener keeping checkout wait times and in-use connections per server,
+    so pool waits can be told apart from server and network time.
+    """
+
+    def __init__(self, slow_checkout_ms: float = 50.0):
+        self.slow_checkout_ms = slow_checkout_ms
+        self._servers = defaultdict(lambda: {"open": 0, "in_use": 0, "max_in_use": 0, "checkouts": 0,
+                                             "checkout_failures": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+                                             "clears": 0})
+
+    def stats(self) -> dict:
+        """Return the counters per server address, with the average checkout wait."""
+        stats = {}
+        for address, server in self._servers.items():
+            server = dict(server)
+            server["wait_ms_avg"] = round(server["wait_ms_total"] / server["checkouts"], 3) if server["checkouts"] else 0.0
+            stats[f"{address[0]}:{address[1]}"] = server
+        return stats
+
+    def _record_wait(self, address, duration: float) -> float:
+        wait_ms = duration * 1000
+        server = self._servers[address]
+        server["wait_ms_total"] += wait_ms
+        server["wait_ms_max"] = max(server["wait_ms_max"], wait_ms)
+        return wait_ms
+
+    def connection_checked_out(self, event):
+        server = self._servers[event.address]
+        server["checkouts"] += 1
+        server["in_use"] += 1
+        server["max_in_use"] = max(server["max_in_use"], server["in_use"])
+        wait_ms = self._record_wait(event.address, event.duration)
+        if wait_ms >= self.slow_checkout_ms:
+            logger.warning("Waited %.1fms for a connection to %s (%s in use)", wait_ms, event.address,
+                           server["in_use"])
+
+    def connection_check_out_failed(self, event):
+        self._servers[event.address]["checkout_failures"] += 1
+        self._record_wait(event.address, event.duration)
+        logger.warning("Connection checkout from %s failed: %s", event.address, event.reason)
+
+    def connection_checked_in(self, event):
+        server = self._servers[event.address]
+        server["in_use"] = max(server["in_use"] - 1, 0)
+
+    def connection_created(self, event):
+        self._servers[event.address]["open"] += 1
+
+    def connection_closed(self, event):
+        server = self._servers[event.address]
+        server["open"] = max(server["open"] - 1, 0)
+
+    def pool_cleared(self, event):
+        self._servers[event.address]["clears"] += 1
+        logger.warning("Connection pool for %s was cleared", event.address)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Command listener keeping the latency of every command name and logging the slow ones.
+    getMores on change stream and tailable awaitData cursors block on the server until data arrives
+    by design, so they're counted apart, as "getMore (awaitData)", and never reported as slow.
+    """
+
+    def __init__(self, slow_command_ms: float = 100.0):
+        self.slow_command_ms = slow_command_ms
+        self._commands = defaultdict(lambda: {"count": 0, "failures": 0, "ms_total": 0.0, "ms_max": 0.0})
+        self._await_cursors = set()
+        # request_id -> ("open", None) for a command opening an awaitData cursor, ("await", cursor_id) for its getMores
+        self._tracked = {}
+
+    def stats(self) -> dict:
+        """Return the counters per command name, with the average latency."""
+        stats = {}
+        for name, command in self._commands.items():
+            command = dict(command)
+            command["ms_avg"] = round(command["ms_total"] / command["count"], 3) if command["count"] else 0.0
+            stats[name] = command
+        return stats
+
+    def _record(self, name: str, event, failed: bool) -> float:
+        duration_ms = event.duration_micros / 1000
+        command = self._commands[name]
+        command["count"] += 1
+        command["failures"] += failed
+        command["ms_total"] += duration_ms
+        command["ms_max"] = max(command["ms_max"], duration_ms)
+        return duration_ms
+
+    @staticmethod
+    def _opens_await_cursor(event) -> bool:
+        command = event.command
+        if event.command_name == "aggregate":
+            return any("$changeStream" in stage for stage in command.get("pipeline", []))
+        return event.command_name == "find" and bool(command.get("tailable") and command.get("awaitData"))
+
+    def _finish_tracked(self, event, cursor_id=None) -> bool:
+        """Follow the awaitData cursors' lifetime; returns True for a getMore on one of them."""
+        kind, tracked_cursor = self._tracked.pop(event.request_id, (None, None))
+        if kind == "open" and cursor_id:
+            self._await_cursors.add(cursor_id)
+        elif kind == "await" and not cursor_id:
+            # An exhausted or failed cursor won't be continued
+            self._await_cursors.discard(tracked_cursor)
+        return kind == "await"
+
+    def started(self, event):
+        if self._opens_await_cursor(event):
+            self._tracked[event.request_id] = ("open", None)
+        elif event.command_name == "getMore" and event.command.get("getMore") in self._await_cursors:
+            self._tracked[event.request_id] = ("await", event.command["getMore"])
+        elif event.command_name == "killCursors":
+            self._await_cursors.difference_update(event.command.get("cursors", []))
+
+    def succeeded(self, event):
+        cursor_id = (event.reply.get("cursor") or {}).get("id")
+        if self._finish_tracked(event, cursor_id):
+            self._record("getMore (awaitData)", event, failed=False)
+            return
+        duration_ms = self._record(event.command_name, event, failed=False)
+        if duration_ms >= self.slow_command_ms:
+            logger.warning("Slow %s command on %s took %.1fms", event.command_name, event.database_name, duration_ms)
+
+    def failed(self, event):
+        name = "getMore (awaitData)" if self._finish_tracked(event) else event.command_name
+        duration_ms = self._record(name, event, failed=True)
+        logger.warning("%s command on %s failed after %.1fms: %s", event.command_name, event.database_name,
+                       duration_ms, event.failure)
+
+
+def connection_stats(pool_monitor: PoolMonitor, command_monitor: CommandMonitor) -> dict:
+    """Snapshot of the pool and command counters."""
+    return {"pool": pool_monitor.stats(), "commands": command_monitor.stats()}
+
+
+async def report_connection_stats(pool_monitor: PoolMonitor, command_monitor: CommandMonitor,
+                                  interval: float = 300.0) -> None:
+    """Log the pool and command counters periodically until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("MongoDB connection stats: %s", connection_stats(pool_monitor, command_monitor))
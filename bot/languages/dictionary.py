@@ -331,6 +331,7 @@ translations = {
         🔴 امسال: *{chat_year}*
         🌍 مجموع چت‌ها: *{chat_all_time}*
         
+         ✉️ پیام های امروز: *{messages_today}*
          ✍️ مجموع پیام ها: *{total_messages}*
         
         📅 تاریخ این آمار: {stats_date}
@@ -348,6 +349,14 @@ translations = {
         
         📅 تاریخ این آمار: {stats_date}
         """),
+                'users_growth': dedent("""
+        📈 *رشد کاربران - {days} روز اخیر* 📈
+
+        {rows}
+
+        📅 تاریخ این آمار: {stats_date}
+        """),
+                'users_growth_row': "🗓️ {date}: *{count}* نفر",
                 'new_user': dedent("""
                 🎉 *کاربر جدید* 🎉
                 
@@ -511,10 +520,11 @@ translations = {
         🚫 لیست کاربران بن شده خالی است.
         """),
                 'list': dedent("""
-        *📋 لیست کاربران بن شده:*
+        *📋 لیست کاربران بن شده ({total} نفر):*
          ------------------------
-        `{ban_list}`
+        {rows}
         """),
+                'row': "🔸 `{anon_id}` - {nickname}\n      ⛔️ {banned_at} - 👮 `{banned_by}`",
         },
         'ad': {
             'force_join': dedent("""
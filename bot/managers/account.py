@@ -3,7 +3,8 @@ import re
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
-from bot.common.database_utils import fetch_user_data_by_id, update_user_fields, get_user_anon_id
+from bot.common.database_utils import fetch_user_data_by_id, update_user_fields, get_user_anon_id, FLAGS_VIEW, \
+    PROFILE_VIEW
 from bot.common.date import convert_timestamp_to_date
 from bot.common.keyboard import KeyboardMarkupGenerator
 from bot.languages.response import get_response
@@ -16,14 +17,14 @@ class AccountManager:
 
     async def account(self, msg: Message):
         """ send the response text """
-        user_data = fetch_user_data_by_id(msg.chat.id)
+        user_data = await fetch_user_data_by_id(msg.chat.id, FLAGS_VIEW)
         
         if user_data.get('is_bot_off'):
-            await self.bot.send_message(msg.chat.id, self.get_account_response(msg),
+            await self.bot.send_message(msg.chat.id, await self.get_account_response(msg),
                                         parse_mode='Markdown',
                                         reply_markup=KeyboardMarkupGenerator().account_buttons(is_bot_off=True))
         else:
-            await self.bot.send_message(msg.chat.id, self.get_account_response(msg),
+            await self.bot.send_message(msg.chat.id, await self.get_account_response(msg),
                                         parse_mode='Markdown',
                                         reply_markup=KeyboardMarkupGenerator().account_buttons())
 
@@ -36,7 +37,7 @@ class AccountManager:
             return  # No valid referral code found
 
         referral_code = referral_code_match.group(1)
-        inviter = users_collection.find_one({"id": referral_code})
+        inviter = await users_collection.find_one({"id": referral_code})
 
         if inviter is None:
             return  # Stop execution if the ID is invalid
@@ -46,7 +47,7 @@ class AccountManager:
         if not inviter:
             return  # Stop execution if inviter is not found
 
-        if fetch_user_data_by_id(invited).get('referred'):
+        if (await fetch_user_data_by_id(invited, PROFILE_VIEW)).get('referred'):
             await self.bot.send_message(invited, get_response('account.referral.referred'))
             return
 
@@ -57,13 +58,13 @@ class AccountManager:
         if invited in inviter.get('referrals', []):
             return  # Already referred by the same inviter, do nothing
 
-        update_user_fields(invited, {'referred': True, 'referred_by': referral_code})
-        update_user_fields(inviter.get("user_id"), "referrals", get_user_anon_id(invited), push=True)
+        await update_user_fields(invited, {'referred': True, 'referred_by': referral_code})
+        await update_user_fields(inviter.get("user_id"), "referrals", await get_user_anon_id(invited), push=True)
 
     @staticmethod
-    def get_account_response(msg: Message):
+    async def get_account_response(msg: Message):
         """ return the response text"""
-        user_data = fetch_user_data_by_id(msg.chat.id)
+        user_data = await fetch_user_data_by_id(msg.chat.id, PROFILE_VIEW)
         joined_at = convert_timestamp_to_date(user_data['joined_at'])
         # referrals = len(user_data.get('referrals'))
         response_data = {
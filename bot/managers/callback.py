@@ -8,11 +8,10 @@ from bot.managers.block import BlockUserManager
 from bot.managers.nickname import NicknameManager
 from bot.managers.settings import SettingsManager
 from bot.managers.start import StartBot
-from bot.database.database import users_collection
 from bot.common.keyboard import KeyboardMarkupGenerator
 from bot.languages.response import get_response
-from bot.common.database_utils import fetch_user_data_by_id, update_user_fields,\
-      get_user_id, get_user_anon_id
+from bot.common.database_utils import get_user_id, get_user_anon_id
+from bot.common.state_utils import enter_reply_mode, end_nickname_await
 from bot.common.user import is_subscribed_to_channel, is_bot_status_off
 from bot.common.utils import generate_anon_link
 from bot.admin.callback import AdminCallbackHandler
@@ -53,7 +52,7 @@ class CallbackHandler:
         """Main method to handle callbacks from the user."""
         callback_data = callback.data
 
-        if is_user_banned(callback.from_user.id):
+        if await is_user_banned(callback.from_user.id):
             await self._send_ban_message(callback)
             return
         # Extract the action type from the callback data
@@ -74,7 +73,7 @@ class CallbackHandler:
         """Handle inline queries."""
         user_id = inline.from_user.id
         text = inline.query.strip() or "حرفتو ناشناس بهم بزن 😉"  # Default text if empty
-        link = generate_anon_link(get_user_anon_id(user_id))
+        link = generate_anon_link(await get_user_anon_id(user_id))
 
         content = InputTextMessageContent(f"{text}")
         result = InlineQueryResultArticle(
@@ -99,12 +98,12 @@ class CallbackHandler:
     async def _process_reply_callback(self, callback: CallbackQuery):
         """Process the reply callback and set the replying state."""
         sender_anon_id, message_id = callback.data.split('-')
-        sender_user_id = get_user_id(sender_anon_id)
+        sender_user_id = await get_user_id(sender_anon_id)
         if await self._check_bot_status(callback, sender_user_id):
             return
 
-        close_chats(callback.from_user.id)
-        self._set_replying_state(callback.from_user.id, message_id, sender_anon_id)
+        await close_chats(callback.from_user.id)
+        await enter_reply_mode(callback.from_user.id, message_id, sender_anon_id)
 
         await self.bot.send_message(
             callback.from_user.id,
@@ -117,12 +116,12 @@ class CallbackHandler:
     async def _process_seen_callback(self, callback: CallbackQuery):
         """Process the seen callback."""
         sender_anon_id, message_id = callback.data.split('-')
-        sender_id = get_user_id(sender_anon_id)
+        sender_id = await get_user_id(sender_anon_id)
 
         if await self._check_bot_status(callback, sender_id):
             return
 
-        add_seen_message(callback.from_user.id, int(message_id))
+        await add_seen_message(callback.from_user.id, int(message_id))
         await self.bot.send_message(
             chat_id=sender_id,
             reply_to_message_id=message_id,
@@ -204,7 +203,7 @@ class CallbackHandler:
         if await self._check_bot_status(callback, callback.from_user.id):
             return
 
-        blocker_anon_id = users_collection.find_one({"user_id": callback.message.chat.id})['id']
+        blocker_anon_id = await get_user_anon_id(callback.message.chat.id)
         await self.blocker.unblock_user(blocker_anon_id, blocked_id, callback)
 
     # async def _process_unblock_callback(self, callback: CallbackQuery):
@@ -227,7 +226,7 @@ class CallbackHandler:
     async def _process_delete_message_callback(self, callback: CallbackQuery):
         """Process the delete message callback"""
         recipient_message_id, recipient_anon_id = callback.data.split('-')
-        await self.bot.delete_message(get_user_id(recipient_anon_id), int(recipient_message_id))
+        await self.bot.delete_message(await get_user_id(recipient_anon_id), int(recipient_message_id))
         await self.bot.edit_message_text(get_response('texting.tools.delete.deleted'),
                                          callback.message.chat.id,
                                          callback.message.id, parse_mode='Markdown')
@@ -238,7 +237,7 @@ class CallbackHandler:
 
     async def _process_change_nickname(self, callback: CallbackQuery):
         """Process the change nickname callback."""
-        response = NicknameManager(self.bot).get_set_nickname_response(callback.message)
+        response = await NicknameManager(self.bot).get_set_nickname_response(callback.message)
         await self.bot.edit_message_text(
             response,
             callback.message.chat.id,
@@ -251,9 +250,9 @@ class CallbackHandler:
         """Process the cancel callback."""
         _, task = callback.data.split('-')
         if task == "changing_nickname":
-            await update_user_fields(callback.from_user.id, 'awaiting_nickname', False)
+            await end_nickname_await(callback.from_user.id)
             await self.bot.edit_message_text(
-                AccountManager(self.bot).get_account_response(callback.message),
+                await AccountManager(self.bot).get_account_response(callback.message),
                 callback.from_user.id,
                 callback.message.id,
                 parse_mode='Markdown',
@@ -267,7 +266,7 @@ class CallbackHandler:
     async def _process_mark_message(self, callback: CallbackQuery):
         """Process the mark message callback."""
         sender_anon_id, message_id = callback.data.split('-')
-        seen = get_seen_status(user_id=callback.message.chat.id, message_id=callback.message.id)
+        seen = await get_seen_status(user_id=callback.message.chat.id, message_id=callback.message.id)
 
         original_text, is_caption = self._get_message_text_or_caption(callback)
         if not original_text:
@@ -291,20 +290,6 @@ class CallbackHandler:
         """Delegate admin-related callbacks to the AdminCallbackHandler."""
         await AdminCallbackHandler(self.bot).handle_callback(callback)
 
-    @staticmethod
-    def _set_replying_state(user_id: int, message_id: str, sender_anon_id: str):
-        """Set the replying state in the database."""
-        users_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "replying": True,
-                    "reply_target_message_id": message_id,
-                    "reply_target_user_id": str(sender_anon_id),
-                },
-            }
-        )
-
     @staticmethod
     def _get_message_text_or_caption(callback: CallbackQuery):
         """Get the text or caption of a message."""
@@ -343,14 +328,14 @@ class CallbackHandler:
 
     async def _check_bot_status(self, callback: CallbackQuery, user_id: str):
         """Verify if the bot status is disabled for the current user or the recipient."""
-        if is_bot_status_off(callback.from_user.id):
+        if await is_bot_status_off(callback.from_user.id):
             await self.bot.answer_callback_query(
                 callback.id,
                 get_response('account.bot_status.self.disabled'),
                 show_alert=True
             )
             return True
-        if is_bot_status_off(user_id):
+        if await is_bot_status_off(user_id):
             await self.bot.answer_callback_query(
                 callback.id,
                 get_response('account.bot_status.recipient.disabled'),
@@ -361,7 +346,7 @@ class CallbackHandler:
 
     async def _validate_block_action(self, callback: CallbackQuery, sender_id: str):
         """Validate block action to prevent blocking self or support."""
-        if sender_id == fetch_user_data_by_id(callback.message.chat.id).get('id'):
+        if sender_id == await get_user_anon_id(callback.message.chat.id):
             await self.bot.answer_callback_query(callback.id, get_response('blocking.self'))
             return False
         if sender_id == 'support':
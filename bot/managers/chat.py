@@ -1,20 +1,20 @@
 import asyncio
 
 import pytz
-from decouple import config
 from jdatetime import datetime
 from telebot.apihelper import ApiTelegramException
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
 from bot.common.chat_utils import close_chats
-from bot.common.database_utils import fetch_user_data_by_id, is_user_banned, update_user_fields, get_user_anon_id, get_user_id, \
-    update_total_messages
+from bot.common.context import UpdateContext
+from bot.common.database_utils import get_user_id, update_total_messages
 from bot.common.keyboard import KeyboardMarkupGenerator
+from bot.common.metrics import record_metric
+from bot.common.conversation import conversation_states
+from bot.common.state_utils import leave_reply_mode, end_nickname_await, finish_editing
 from bot.languages.response import get_response
 from bot.common.threads import delete_message
-from bot.common.user import is_bot_status_off
-from bot.database.database import users_collection
 from bot.managers.account import AccountManager
 from bot.managers.block import BlockUserManager
 from bot.managers.link import LinkManager
@@ -26,22 +26,17 @@ from bot.managers.support import SupportManager
 class ChatHandler:
     def __init__(self, bot: AsyncTeleBot):
         self.bot = bot
-        self.current_version = config('VERSION', cast=float)
 
     async def anonymous_chat(self, msg: Message):
         """Main method to handle anonymous chat with support for different media types."""
         self.msg = msg
-        user_chat = fetch_user_data_by_id(self.msg.chat.id)
+        ctx = await UpdateContext.load(self.msg.chat.id)
 
-        if not user_chat:
+        if not ctx.user:
             await StartBot(self.bot).start(msg)
             return
 
-        user_version = user_chat.get('version', 0.0)
-        if user_version != self.current_version:
-            await self._handle_version_mismatch(msg)
-            return
-        if is_user_banned(user_chat.get('user_id')):
+        if ctx.is_banned:
             await self.bot.send_message(msg.chat.id, get_response('account.ban.banned'),
                                         reply_markup=KeyboardMarkupGenerator().main_buttons())
             return
@@ -64,10 +59,11 @@ class ChatHandler:
             await keyboard_commands[msg.text]()
             return
 
-        # Handle the chat message
-        await self._handle_media(msg)
+        # Handle the chat message; the user writes it makes are committed together once it's handled
+        async with ctx.uow:
+            await self._handle_media(msg, ctx)
 
-    async def _handle_media(self, msg: Message):
+    async def _handle_media(self, msg: Message, ctx: UpdateContext):
         """Dispatch the handling of media based on the message type."""
         media_mapping = {
             "text": {"is_text": True},
@@ -82,34 +78,33 @@ class ChatHandler:
 
         for media_type, kwargs in media_mapping.items():
             if getattr(msg, media_type, None):
-                await self._process_chat(msg, **kwargs)
+                await self._process_chat(msg, ctx, **kwargs)
                 return
 
         # Handle unknown media
         await self.bot.send_message(msg.chat.id, get_response("errors.unknown_media"))
 
-    async def _process_chat(self, msg: Message, **kwargs):
+    async def _process_chat(self, msg: Message, ctx: UpdateContext, **kwargs):
         """Process the chat based on the type of message."""
-        user_chat = fetch_user_data_by_id(msg.from_user.id)
-        open_chat = next((chat for chat in user_chat.get('chats', []) if chat.get('open')), None)
+        state = ctx.state
+        open_chat = await ctx.load_open_chat()
 
         # Check if the user is in awaiting nickname state and trying to send a message, if so set the state to false
         # so the text they send serves as a message and doesn't set to their nickname.
         # this condition happens when someone is in awaiting nickname state and set their replying state to True or open a chat.
-        if open_chat or user_chat.get('replying') and user_chat.get('awaiting_nickname'):
-            users_collection.update_one({'user_id': msg.chat.id}, {'$set': {'awaiting_nickname': False}})
-            user_chat = fetch_user_data_by_id(msg.chat.id)
+        if (open_chat or state.replying) and state.awaiting_nickname:
+            ctx.state = state = conversation_states.update(ctx.user_id, awaiting_nickname=False)
         # Check if the user is in replying state, if so handle the text as reply message.
-        if user_chat.get('replying'):
-            await self._handle_reply(msg, user_chat)
+        if state.replying:
+            await self._handle_reply(msg, ctx)
             return
         # Check if the user is in awaiting nickname state, if so handle the text as nickname.
-        if user_chat.get('awaiting_nickname'):
-            await NicknameManager(self.bot).save_nickname(msg)
+        if state.awaiting_nickname:
+            await NicknameManager(self.bot).save_nickname(msg, ctx.uow)
             return
 
-        if msg.reply_to_message and msg.reply_to_message.id == user_chat.get('editing_prompt_message_id'):
-            await self._handle_editing(msg, user_chat)
+        if msg.reply_to_message and msg.reply_to_message.id == state.editing_prompt_message_id:
+            await self._handle_editing(msg, ctx)
             return
         # Check if there is any open chat when the user sent the message
         if not open_chat:
@@ -118,25 +113,35 @@ class ChatHandler:
 
         # Check if the target user blocked the user
         target_user_id = open_chat.get('target_user_id')
-        if await BlockUserManager.is_user_blocked(user_chat.get('id'), target_user_id):
-            close_chats(user_chat.get('user_id'))
+        if not await ctx.load_recipient({"user_id": target_user_id}):
+            await close_chats(ctx.user_id)
+            await self.bot.send_message(msg.chat.id, get_response('errors.user_not_found'),
+                                        reply_markup=KeyboardMarkupGenerator().main_buttons())
+            return
+        if await ctx.is_blocked():
+            await close_chats(ctx.user_id)
             await self.bot.send_message(msg.chat.id, get_response('blocking.blocked_by_user'),
                                         reply_markup=KeyboardMarkupGenerator().main_buttons())
+            return
         # check if the target user changed the bot status to off
-        if is_bot_status_off(target_user_id):
-            close_chats(user_chat.get('user_id'))
+        if ctx.is_recipient_bot_off:
+            await close_chats(ctx.user_id)
             await self.bot.send_message(msg.chat.id, get_response('account.bot_status.recipient.off'),
                                         reply_markup=KeyboardMarkupGenerator().main_buttons())
+            return
 
         # if everything is fine, forward the message
-        await self._handle_forward(msg, target_user_id, **kwargs)
+        await self._handle_forward(msg, ctx, **kwargs)
 
-    async def _send_media(self, msg: Message, recipient_id: int, sender_anon_id: str, reply_to_message_id=None):
+    async def _send_media(self, msg: Message, recipient_id: int, sender_anon_id: str, recipient_anon_id: str,
+                          reply_to_message_id=None, reset_replying=False):
         """
         Send media based on its type.
         :param recipient_id: recipient user id.
         :param sender_anon_id: sender anonymous id.
+        :param recipient_anon_id: recipient anonymous id.
         :param reply_to_message_id: reply message id.
+        :param reset_replying: whether to also leave the replying state once sent.
         """
         global target_message
         caption = msg.caption if msg.caption else ""
@@ -176,68 +181,66 @@ class ChatHandler:
                 #     msg.chat.id, get_response('texting.sending.text.sent'),
                 #     parse_mode='Markdown'
                 # )
-            close_chats(msg.from_user.id)
+            await close_chats(msg.from_user.id, reset_replying)
             await self.bot.send_message(
                 msg.chat.id, get_response('texting.sending.text.sent'),
                 parse_mode='Markdown', reply_markup=KeyboardMarkupGenerator().main_buttons(),
                 reply_to_message_id=msg.id
             )
             await update_total_messages(1)
+            record_metric("messages")
             tools_message = await self.bot.send_message(msg.chat.id, get_response('texting.tools.announce'),
                                                         reply_markup=KeyboardMarkupGenerator().sender_buttons(
                                                             target_message.id,
-                                                            get_user_anon_id(
-                                                                recipient_id)),
+                                                            recipient_anon_id),
                                                         reply_to_message_id=msg.id)
             asyncio.create_task(delete_message(self.bot, msg.chat.id, tools_message.id, minutes=0.09))
         except ApiTelegramException:
-            self._handle_bot_blocked(msg)
+            await self._handle_bot_blocked(msg)
 
-    async def _handle_forward(self, msg: Message, recipient_id: int, **kwargs):
+    async def _handle_forward(self, msg: Message, ctx: UpdateContext, **kwargs):
         """
-        Forward media to a recipient.
-
-        :param recipient_id: recipient user id.
+        Forward media to the recipient loaded in the update context.
         """
-        sender_anon_id = fetch_user_data_by_id(msg.chat.id).get('id')
-        await self._send_media(msg, recipient_id, sender_anon_id)
+        await self._send_media(msg, ctx.recipient['user_id'], ctx.anon_id, ctx.recipient['id'])
 
-    async def _handle_reply(self, msg: Message, user_chat):
+    async def _handle_reply(self, msg: Message, ctx: UpdateContext):
         """Handle replies to a message."""
-        recipient_id, original_message_id = user_chat['reply_target_user_id'], user_chat['reply_target_message_id']
-        recipient_user = users_collection.find_one({"id": recipient_id})
+        recipient_id, original_message_id = ctx.state.reply_target_user_id, ctx.state.reply_target_message_id
+        recipient_user = await ctx.load_recipient({"id": recipient_id})
 
         if not recipient_user:
-            close_chats(msg.chat.id, True)
+            await close_chats(msg.chat.id, True)
             await self.bot.send_message(
                 msg.chat.id, get_response('errors.user_not_found'),
                 reply_markup=KeyboardMarkupGenerator().main_buttons()
             )
             return
 
-        if await BlockUserManager.is_user_blocked(user_chat.get("id"), recipient_user.get('user_id')):
-            close_chats(msg.chat.id, True)
+        if await ctx.is_blocked():
+            await close_chats(msg.chat.id, True)
             await self.bot.send_message(
                 msg.chat.id, get_response('blocking.blocked_by_user'),
                 reply_markup=KeyboardMarkupGenerator().main_buttons()
             )
             return
 
-        sender_anon_id = user_chat.get('id')
-        await self._send_media(msg, recipient_user['user_id'], sender_anon_id, reply_to_message_id=original_message_id)
-        close_chats(msg.from_user.id, True)
+        await self._send_media(msg, recipient_user['user_id'], ctx.anon_id, recipient_id,
+                               reply_to_message_id=original_message_id, reset_replying=True)
 
-    async def _handle_editing(self, msg: Message, user_chat):
+    async def _handle_editing(self, msg: Message, ctx: UpdateContext):
         """Handle editing of a message."""
-        target_id = get_user_id(user_chat.get('editing_target_anon_id'))
+        state = ctx.state
+        target_id = await get_user_id(state.editing_target_anon_id)
         try:
             jdate = datetime.now(pytz.timezone('Asia/Tehran')).strftime('%H:%M %Y/%m/%d')
             # Edit the target message
+            sender_anon_id = ctx.anon_id
             await self.bot.edit_message_text(
                 chat_id=target_id,
-                message_id=int(user_chat.get('editing_target_message_id')),
-                text=get_response('texting.tools.editing.recipient', message=msg.text, anon_id=get_user_anon_id(msg.chat.id), edited_at=jdate),
-                reply_markup=KeyboardMarkupGenerator().recipient_buttons(get_user_anon_id(msg.chat.id), msg.id)
+                message_id=int(state.editing_target_message_id),
+                text=get_response('texting.tools.editing.recipient', message=msg.text, anon_id=sender_anon_id, edited_at=jdate),
+                reply_markup=KeyboardMarkupGenerator().recipient_buttons(sender_anon_id, msg.id)
             )
 
             # Confirm the edit
@@ -249,10 +252,7 @@ class ChatHandler:
             )
 
             # Clear the editing-related fields
-            update_user_fields(msg.chat.id, {
-                "editing_target_message_id": int(),
-                "editing_prompt_message_id": int()
-            })
+            await finish_editing(msg.chat.id)
 
         except Exception as e:
             print(f"Unable to edit the message. Error: {e}")
@@ -276,24 +276,20 @@ class ChatHandler:
         await AccountManager(self.bot).account(self.msg)
 
     async def cancel_chat_or_reply(self, msg: Message):
-        user_chat = fetch_user_data_by_id(msg.from_user.id)
-        open_chat = next((chat for chat in user_chat.get('chats', []) if chat.get('open')), None)
-
-        if user_chat.get("replying"):
-            close_chats(msg.from_user.id, True)
+        # Each transition only applies when the user is in that state, so trying them in order needs no read
+        user_id = msg.from_user.id
+        if await leave_reply_mode(user_id):
+            await close_chats(user_id)
             await self.bot.send_message(
                 msg.chat.id, get_response('texting.replying.cancelled'), parse_mode='Markdown',
                 reply_markup=KeyboardMarkupGenerator().main_buttons()
             )
-        elif open_chat:
-            self._update_chat_field(msg.from_user.id, "chats.$.open", False,
-                                    {"user_id": msg.from_user.id, "chats.open": True})
+        elif await close_chats(user_id):
             await self.bot.send_message(
                 msg.chat.id, get_response('texting.sending.cancelled'), parse_mode='Markdown',
                 reply_markup=KeyboardMarkupGenerator().main_buttons()
             )
-        elif user_chat.get('awaiting_nickname'):
-            self._update_user_field(msg.from_user.id, "awaiting_nickname", False)
+        elif await end_nickname_await(user_id):
             await self.bot.send_message(msg.from_user.id, get_response('nickname.cancelled'),
                                         parse_mode='Markdown',
                                         reply_markup=KeyboardMarkupGenerator().main_buttons())
@@ -302,25 +298,7 @@ class ChatHandler:
                 msg.chat.id, get_response('errors.no_cancel'), parse_mode='Markdown'
             )
 
-    async def _handle_version_mismatch(self, msg: Message):
-        """Handle version mismatch by prompting a restart and updating the version."""
-        users_collection.update_one(
-            {'user_id': msg.from_user.id},
-            {'$set': {'version': self.current_version}}
-        )
-        await StartBot(self.bot).start(msg)
-
-    def _handle_bot_blocked(self, msg: Message):
-        close_chats(msg.chat.id, True)
-        self.bot.send_message(msg.chat.id, get_response('errors.bot_blocked'),
+    async def _handle_bot_blocked(self, msg: Message):
+        await close_chats(msg.chat.id, True)
+        await self.bot.send_message(msg.chat.id, get_response('errors.bot_blocked'),
                               reply_markup=KeyboardMarkupGenerator().main_buttons())
-
-    @staticmethod
-    def _update_user_field(user_id, field, value):
-        users_collection.update_one({"user_id": user_id}, {"$set": {field: value}})
-
-    @staticmethod
-    def _update_chat_field(user_id, field, value, query=None):
-        if not query:
-            query = {"user_id": user_id, "chats.open": True}
-        users_collection.update_one(query, {"$set": {field: value}})
@@ -12,7 +12,7 @@ class LinkManager:
         self.bot = bot
 
     async def link(self, msg: Message):
-        user_bot_id = users_collection.find_one({"user_id": msg.from_user.id})['id']
+        user_bot_id = (await users_collection.find_one({"user_id": msg.from_user.id}, {"_id": 0, "id": 1}))['id']
         link = generate_anon_link(user_bot_id)
         await self.bot.send_message(
             msg.chat.id,
@@ -3,11 +3,12 @@ import random
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
-from bot.database.database import users_collection
 from bot.common.keyboard import KeyboardMarkupGenerator
 from bot.languages.response import get_response
 from bot.common.chat_utils import close_chats
-from bot.common.database_utils import update_user_fields
+from bot.common.database_utils import fetch_user_data_by_id, IDENTITY_VIEW
+from bot.common.state_utils import begin_nickname_await, end_nickname_await
+from bot.common.unit_of_work import UnitOfWork
 from bot.common.validators import NicknameValidator
 
 
@@ -17,16 +18,19 @@ class NicknameManager:
 
     async def set_nickname(self, msg: Message):
         """Set a Nickname for the user."""
-        user_data = users_collection.find_one_and_update({'user_id': msg.chat.id},
-                                                         {'$set': {'awaiting_nickname': True}})
+        await close_chats(msg.chat.id)
+        await begin_nickname_await(msg.chat.id)
+        user_data = await fetch_user_data_by_id(msg.chat.id, IDENTITY_VIEW)
         current_first_name = msg.from_user.first_name
-        close_chats(msg.chat.id, True)
         await self.bot.send_message(msg.chat.id,
                                     get_response('nickname.ask_nickname', current_nickname=user_data['nickname'], current_firstname=current_first_name),
                                     parse_mode='Markdown', reply_markup=KeyboardMarkupGenerator().cancel_buttons())
 
-    async def save_nickname(self, msg: Message):
-        """Save the user's nickname after they provide it."""
+    async def save_nickname(self, msg: Message, uow: UnitOfWork = None):
+        """
+        Save the user's nickname after they provide it.
+        :param uow: unit of work of the current update, if any; the write is queued on it.
+        """
         user_id = msg.from_user.id
         nickname = msg.text.strip()
 
@@ -35,8 +39,11 @@ class NicknameManager:
         is_valid, validation_message = validator.validate_nickname(nickname)
         if is_valid:
             # Proceed to store the user data if the nickname is valid
-            update_user_fields(user_id, "nickname", nickname)
-            update_user_fields(user_id, "awaiting_nickname", False)
+            if uow is not None:
+                uow.set(user_id, "nickname", nickname)
+                await end_nickname_await(user_id)
+            else:
+                await end_nickname_await(user_id, nickname)
             await self.bot.send_message(
                 msg.chat.id,
                 get_response('nickname.nickname_was_set', nickname),
@@ -51,10 +58,10 @@ class NicknameManager:
             )
 
     @staticmethod
-    def get_set_nickname_response(msg: Message):
+    async def get_set_nickname_response(msg: Message):
         """return set nickname response"""
-        user_data = users_collection.find_one_and_update({'user_id': msg.chat.id},
-                                                         {'$set': {'awaiting_nickname': True}})
+        await begin_nickname_await(msg.chat.id)
+        user_data = await fetch_user_data_by_id(msg.chat.id, IDENTITY_VIEW)
         current_first_name = msg.chat.first_name
         return get_response('nickname.ask_nickname', current_nickname=user_data['nickname'], current_firstname=current_first_name)
 
@@ -14,7 +14,7 @@ class SettingsManager:
 
     async def change_bot_status(self, callback: CallbackQuery):
         user_id = callback.message.chat.id
-        if is_bot_status_off(user_id):
+        if await is_bot_status_off(user_id):
             await update_user_fields(user_id, 'is_bot_off', False)
             await self.bot.answer_callback_query(callback_query_id=callback.id,
                                                  text=get_response("account.bot_status.self.status_changed", status="روشن 😁"))
@@ -1,19 +1,20 @@
 import re
-from datetime import datetime
 
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import Message
 
 from bot.admin.adminstration import Admin
-from bot.common.chat_utils import close_chats
-from bot.common.database_utils import is_user_banned, save_user_data, fetch_user_data_by_id, user_exists, update_user_fields, \
-    get_user_anon_id
+from bot.common.block_utils import is_blocked
+from bot.common.chat_utils import close_chats, ensure_chats_migrated, open_chat, create_chat, with_legacy_chats
+from bot.common.database_utils import is_user_banned, save_user_data, fetch_user_data_by_id, user_exists, \
+    fetch_user_data_by_query, IDENTITY_VIEW, FLAGS_VIEW
 from bot.common.keyboard import KeyboardMarkupGenerator
+from bot.common.metrics import record_metric
+from bot.common.stats import stats_rollup
+from bot.common.unit_of_work import UnitOfWork
 from bot.common.user import is_bot_status_off
-from bot.database.database import users_collection
 from bot.languages.response import get_response
 from bot.managers.account import AccountManager
-from bot.managers.block import BlockUserManager
 
 
 class StartBot:
@@ -21,16 +22,21 @@ class StartBot:
         self.bot = bot
 
     async def start(self, msg: Message, default_target_anon_id=None):
+        # The user writes made while starting are committed together at the end
+        uow = UnitOfWork()
         try:
             user_id = msg.chat.id
             nickname = msg.from_user.first_name
             target_anon_id = default_target_anon_id or await self._get_target_user_id(msg)
 
-            # If the user doesn't exist in the database, store their data
-            if not await user_exists(user_id):
+            # If the user doesn't exist in the database, store their data. Both paths below greet a new user,
+            # so the document is stored with first_time already cleared instead of clearing it afterwards.
+            is_new_user = not await user_exists(user_id)
+            if is_new_user:
                 await save_user_data(user_id, nickname=nickname, username=msg.from_user.username or None,
-                               first_name=msg.from_user.first_name or None, last_name=msg.from_user.last_name or None)
-            if is_user_banned(user_id):
+                               first_name=msg.from_user.first_name or None, last_name=msg.from_user.last_name or None,
+                               first_time=False)
+            if await is_user_banned(user_id):
                 await self.bot.send_message(user_id, get_response('account.ban.banned'))
                 return
 
@@ -39,8 +45,10 @@ class StartBot:
             #                                 reply_markup=KeyboardMarkupGenerator().force_join_buttons())
             #     return
             # Retrieve user data from the database
-            user_data = users_collection.find_one({"user_id": user_id})
-            if not target_anon_id and user_data.get('first_time'):
+            user_data = await fetch_user_data_by_id(user_id, with_legacy_chats(FLAGS_VIEW))
+            await ensure_chats_migrated(user_data)
+            first_time = is_new_user or user_data.get('first_time')
+            if not target_anon_id and first_time:
                 parts = msg.text.split()[1:]  # Get arguments after /start
                 if parts and str(parts[0]).startswith('ref_'):  # Check if parts is not empty before accessing index 0
                     await AccountManager(self.bot).referral(msg)
@@ -52,16 +60,17 @@ class StartBot:
                 )
                 await Admin(self.bot).announce_new_user(user_id)
                 # Update the user field to mark them as not first time
-                await update_user_fields(user_id, 'first_time', False)
+                if not is_new_user:
+                    uow.set(user_id, 'first_time', False)
                 return
             # If no target user provided, close any open chats and send a general welcome message
             if not target_anon_id:
-                close_chats(user_id)
+                await close_chats(user_id)
                 await self._send_welcome_message(msg)
                 return
 
             # If it's the user's first time, show a welcome message and explain the process
-            if user_data.get('first_time'):
+            if first_time:
                 await self.bot.send_message(
                     msg.chat.id,
                     get_response('greeting.first_time', nickname=nickname),
@@ -69,9 +78,10 @@ class StartBot:
                     parse_mode='Markdown',
                 )
                 await Admin(self.bot).announce_new_user(user_id)
-                await update_user_fields(user_id, 'first_time', False)
+                if not is_new_user:
+                    uow.set(user_id, 'first_time', False)
             # Retrieve target user data
-            target_user_data = users_collection.find_one({"id": target_anon_id})
+            target_user_data = await fetch_user_data_by_query({"id": target_anon_id}, IDENTITY_VIEW)
             if not target_user_data:
                 await self.bot.send_message(user_id, get_response('errors.no_user_found'))
                 return
@@ -81,7 +91,7 @@ class StartBot:
                 await self.bot.send_message(user_id, get_response('errors.cant_message_self'))
 
             # Check if the user is blocked by the target user
-            if await BlockUserManager.is_user_blocked(user_data.get('id'), target_user_data["user_id"]):
+            if await is_blocked(user_data.get('id'), target_user_data["id"]):
                 await self.bot.send_message(
                     msg.chat.id,
                     get_response('blocking.blocked_by_user'),
@@ -90,7 +100,7 @@ class StartBot:
                 return
 
             # Check if the user's bot status is off
-            if is_bot_status_off(user_id):
+            if await is_bot_status_off(user_id):
                 await self.bot.send_message(
                     msg.chat.id,
                     get_response('account.bot_status.self.off'),
@@ -100,7 +110,7 @@ class StartBot:
                 return
 
             # Check if the target user's bot status is off
-            if is_bot_status_off(target_user_data["user_id"]):
+            if await is_bot_status_off(target_user_data["user_id"]):
                 await self.bot.send_message(
                     msg.chat.id,
                     get_response('account.bot_status.recipient.off'),
@@ -110,12 +120,14 @@ class StartBot:
                 return
 
             # Manage chats if all checks pass
-            close_chats(user_id, True)
+            await close_chats(user_id, True)
             await self._manage_chats(user_data, target_user_data)
 
         except (ValueError, IndexError) as e:
             print("Error in start method:", str(e))
             await self._send_error_message(msg, 'errors.wrong_id')
+        finally:
+            await uow.commit()
 
     @staticmethod
     async def _get_target_user_id(msg: Message):
@@ -132,68 +144,25 @@ class StartBot:
         user_id = user_data['user_id']
         target_user_id = target_user_data['user_id']
 
-        # Close existing chats only if they are not with the target user
-        if not any(chat['target_user_id'] == target_user_id and chat['open'] for chat in user_data.get('chats', [])):
-            close_chats(user_id)
-
-        # Check if there's already an open chat with the target user
-        if any(chat['target_user_id'] == target_user_id for chat in user_data.get('chats', [])):
-            await self._reopen_chat(user_id, target_user_id, target_user_data['nickname'])
-        else:
-            await self._create_new_chat(user_id, target_user_id, target_user_data['nickname'])
-
-    async def _reopen_chat(self, user_id: int, target_user_id: int, target_user_nickname: str):
-        users_collection.update_one(
-            {"user_id": user_id, "chats.target_user_id": target_user_id},
-            {
-                "$set": {
-                    "chats.$.open": True,
-                    "chats.$.chat_started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                }
-            }
-        )
-        await self.bot.send_message(user_id, get_response('texting.sending.text.send', nickname=target_user_nickname),
+        # Other chats were already closed by the caller; reopen the chat with the target user or create it
+        chat = await open_chat(user_id, target_user_id, target_user_data['id'])
+        if chat['chat_created_at'] == chat['chat_started_at']:
+            await self._create_new_chat(user_id, target_user_id, user_data['id'])
+        await self.bot.send_message(user_id, get_response('texting.sending.text.send',
+                                                          nickname=target_user_data['nickname']),
                                     parse_mode='Markdown', reply_markup=KeyboardMarkupGenerator().cancel_buttons())
 
-    async def _create_new_chat(self, user_id: int, target_user_id: int, target_user_nickname: str):
-        target_user_bot_id = users_collection.find_one({"user_id": target_user_id})['id']
-        users_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$push": {
-                    "chats": {
-                        "target_user_bot_id": target_user_bot_id,
-                        "target_user_id": target_user_id,
-                        "chat_created_at": datetime.timestamp(datetime.now()),
-                        "chat_started_at": datetime.timestamp(datetime.now()),
-                        "open": True
-                    }
-                }
-            },
-            upsert=True
-        )
+    @staticmethod
+    async def _create_new_chat(user_id: int, target_user_id: int, user_anon_id: str):
         # create the chat for the target user with the sender information
-        users_collection.update_one(
-            {"user_id": target_user_id},
-            {
-                "$push": {
-                    "chats": {
-                        "target_user_anon_id": get_user_anon_id(user_id),
-                        "target_user_id": user_id,
-                        "chat_created_at": datetime.timestamp(datetime.now()),
-                        "chat_started_at": datetime.timestamp(datetime.now()),
-                        "open": False
-                    }
-                }
-            },
-            upsert=True
-        )
-        await self.bot.send_message(user_id, get_response('texting.sending.text.send', nickname=target_user_nickname),
-                                    parse_mode='Markdown', reply_markup=KeyboardMarkupGenerator().cancel_buttons())
+        target_chat_created = await create_chat(target_user_id, user_id, user_anon_id)
+        record_metric("chats")
+        # The rollup counts chat documents, like its recount: the user's own and the target's if it was new
+        await stats_rollup.record("chats", 1 + target_chat_created)
 
     async def _send_welcome_message(self, msg: Message):
         """Send a welcome message to the user."""
-        nickname = fetch_user_data_by_id(msg.chat.id).get('nickname')
+        nickname = (await fetch_user_data_by_id(msg.chat.id, IDENTITY_VIEW)).get('nickname')
         await self.bot.send_message(msg.chat.id, get_response('greeting.welcome', nickname=nickname),
                                     reply_markup=KeyboardMarkupGenerator().main_buttons())
 
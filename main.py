@@ -10,13 +10,27 @@ from decouple import config
 from telebot.async_telebot import AsyncTeleBot
 
 from bot.admin.adminstration import Admin
+from bot.admin.bot_administration import BotAdministration, admin_stats
 from bot.admin.user_administration import UserAdministration
 from bot.managers.block import BlockUserManager
 from bot.managers.callback import CallbackHandler
 from bot.managers.chat import ChatHandler
 from bot.managers.nickname import NicknameManager
 from bot.managers.start import StartBot
-from bot.database.database import init_bot_config
+from bot.common.bans import ban_registry, migrate_ban_list
+from bot.common.block_utils import migrate_blocklists
+from bot.common.chat_utils import migrate_embedded_chats, migrate_seen_messages
+from bot.common.conversation import conversation_states
+from bot.common.counters import bot_counters
+from bot.common.database_utils import user_cache
+from bot.common.metrics import metric_counters
+from bot.common.resolver import anon_id_resolver
+from bot.common.stats import stats_rollup
+from bot.common.state_utils import import_legacy_states, drop_legacy_state_fields
+from bot.common.tasks import create_background_task
+from bot.database.database import init_database, init_bot_config, close_database, pool_monitor, command_monitor
+from bot.database.migrations import run_migrations
+from bot.database.monitoring import connection_stats, report_connection_stats
 # Logging Configuration
 def setup_logger():
     """Sets up the logger with color support."""
@@ -70,13 +84,53 @@ bot.register_message_handler(chat_handler.anonymous_chat,
 bot.register_callback_query_handler(callback_handler.handle_callback, func=lambda call: True)
 bot.register_inline_handler(callback_handler.handle_inline_query, func=lambda call: True)
 
-if __name__ == '__main__':
-    try:
-        init_bot_config()  # Ensure default config is set
 
+async def main():
+    """Prepare the database and run the bot on a single event loop."""
+    await init_database()
+    await init_bot_config()  # Ensure default config is set
+    await migrate_ban_list()  # Before loading, so legacy bans are in the registry
+    await ban_registry.load()
+    background = [create_background_task(ban_registry.watch(), name="ban watcher")]
+    await conversation_states.load()
+    await import_legacy_states()  # Before polling, so it can't overwrite newer state
+    background += [
+        create_background_task(conversation_states.run(), name="states snapshotter"),
+        create_background_task(run_migrations(), name="schema migration"),
+        create_background_task(migrate_embedded_chats(), name="embedded chats migration"),
+        create_background_task(migrate_seen_messages(), name="seen messages migration"),
+        create_background_task(migrate_blocklists(), name="blocklists migration"),
+        create_background_task(drop_legacy_state_fields(), name="legacy state cleanup"),
+        create_background_task(anon_id_resolver.warm(), name="resolver warmup"),
+        create_background_task(bot_counters.run(), name="bot counters flusher"),
+        create_background_task(metric_counters.run(), name="metric counters flusher"),
+        create_background_task(stats_rollup.run(
+            BotAdministration.recount, interval=config('STATS_RECONCILE_INTERVAL', default=3600, cast=float)),
+            name="stats reconciler"),
+        create_background_task(admin_stats.run(), name="stats refresher"),
+        create_background_task(report_connection_stats(
+            pool_monitor, command_monitor, interval=config('MONGO_STATS_INTERVAL', default=300, cast=float)),
+            name="connection reporter"),
+    ]
+    try:
         logger.info("Starting bot")
-        asyncio.run(bot.polling(none_stop=True))
+        await bot.polling(none_stop=True)
         logger.info("Bot Stopped")
+    finally:
+        for task in background:
+            task.cancel()
+        # Let every task unwind (e.g. a flush put back what it hadn't written) before the final flushes
+        await asyncio.gather(*background, return_exceptions=True)
+        await conversation_states.close()
+        await bot_counters.close()
+        await metric_counters.close()
+        logger.info("User cache stats: %s", user_cache.stats())
+        logger.info("MongoDB connection stats: %s", connection_stats(pool_monitor, command_monitor))
+        await close_database()
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
     except (asyncio.CancelledError, RuntimeError, ValueError) as e:
         logger.error("Error: %s", e)
 
@@ -0,0 +1,41 @@
+import unittest
+
+from bot.common.unit_of_work import UnitOfWork
+
+
+class UnitOfWorkListUpdatesTest(unittest.TestCase):
+    def setUp(self):
+        self.uow = UnitOfWork(collection=None)
+
+    def test_push_then_add_to_set_keeps_both_values(self):
+        self.uow.push(1, "tags", "b")
+        self.uow.add_to_set(1, "tags", "c")
+        self.uow.add_to_set(1, "tags", "b")
+        self.assertEqual(self.uow._operations(), {1: {"$push": {"tags": {"$each": ["b", "c"]}}}})
+
+    def test_add_to_set_then_push_keeps_both_values(self):
+        self.uow.add_to_set(1, "tags", "c")
+        self.uow.add_to_set(1, "tags", "c")
+        self.uow.push(1, "tags", "b")
+        self.assertEqual(self.uow._operations(), {1: {"$push": {"tags": {"$each": ["c", "b"]}}}})
+
+    def test_add_to_set_alone_stays_add_to_set(self):
+        self.uow.add_to_set(1, "tags", "c")
+        self.uow.add_to_set(1, "tags", "c")
+        self.assertEqual(self.uow._operations(), {1: {"$addToSet": {"tags": {"$each": ["c"]}}}})
+
+    def test_set_replaces_queued_appends(self):
+        self.uow.push(1, "tags", "b")
+        self.uow.add_to_set(1, "tags", "c")
+        self.uow.set(1, "tags", ["a"])
+        self.uow.push(1, "tags", "d")
+        self.assertEqual(self.uow._operations(), {1: {"$set": {"tags": ["a", "d"]}}})
+
+    def test_append_to_field_set_to_scalar_raises(self):
+        self.uow.set(1, "tags", 1)
+        with self.assertRaises(ValueError):
+            self.uow.push(1, "tags", 2)
+
+
+if __name__ == '__main__':
+    unittest.main()